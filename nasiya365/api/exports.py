@@ -0,0 +1,160 @@
+"""
+Contract Export API for Nasiya365
+Streams many contract PDFs as one ZIP or merged PDF, built in a temporary
+file one document at a time
+"""
+
+import os
+import tempfile
+import zipfile
+
+import frappe
+from frappe import _
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+from nasiya365.utils.pdf import get_cached_pdf, get_content_hash, html_to_pdf, render_contract_htmls
+
+
+# Contracts rendered per batch of grouped context queries
+EXPORT_CHUNK_SIZE = 20
+
+# Uncached contracts are rendered inside the web request, so an export is
+# capped to keep it within the request timeout. Override with
+# nasiya365_export_limit.
+EXPORT_LIMIT = 200
+
+# A merged PDF keeps page objects in memory until it is written; larger
+# exports must use ZIP. Override with nasiya365_merged_export_limit.
+MERGED_EXPORT_LIMIT = 500
+
+
+@frappe.whitelist()
+def export_contracts(contracts=None, filters=None, output="zip"):
+    """
+    Download the PDFs of many contracts as one file
+
+    Args:
+        contracts: list (or JSON) of Contract names
+        filters: Contract filters, e.g. {"status": "Подписан",
+            "contract_date": ["between", ["2026-10-01", "2026-10-31"]]}
+        output: "zip" (one PDF per contract) or "pdf" (merged, needs pypdf)
+
+    Each PDF is rendered (or taken from the PDF cache), written to a
+    temporary file and released before the next one; the result is
+    streamed from disk. Contracts that fail to render are listed in
+    errors.txt inside the ZIP; a merged PDF is not produced at all. Both
+    are limited to EXPORT_LIMIT contracts per download.
+    """
+    if isinstance(contracts, str):
+        contracts = frappe.parse_json(contracts)
+    if isinstance(filters, str):
+        filters = frappe.parse_json(filters)
+
+    if contracts:
+        filters = {"name": ("in", contracts)}
+    names = frappe.get_list("Contract", filters=filters or {}, pluck="name", order_by="name", limit_page_length=0)
+    if not names:
+        frappe.throw(_("Нет договоров для экспорта"))
+
+    limit = frappe.conf.get("nasiya365_export_limit") or EXPORT_LIMIT
+    if len(names) > limit:
+        frappe.throw(_("Слишком много договоров для одной выгрузки ({0}), не более {1}").format(len(names), limit))
+
+    if output == "pdf":
+        limit = frappe.conf.get("nasiya365_merged_export_limit") or MERGED_EXPORT_LIMIT
+        if len(names) > limit:
+            frappe.throw(_("Слишком много договоров для одного PDF ({0}), выберите ZIP").format(len(names)))
+        fh = _write_merged(names)
+        return _stream(fh, "contracts.pdf", "application/pdf")
+
+    fh = _write_zip(names)
+    return _stream(fh, "contracts.zip", "application/zip")
+
+
+def iter_contract_pdfs(names, failed):
+    """
+    Yield (contract name, path or bytes) per contract, one at a time
+
+    Cached PDFs are yielded as file paths so they are never read into
+    memory; new ones are rendered and yielded as bytes. Contracts that
+    fail to render are logged and appended to `failed` as (name, error).
+    """
+    for start in range(0, len(names), EXPORT_CHUNK_SIZE):
+        for name, rendered in render_contract_htmls(names[start:start + EXPORT_CHUNK_SIZE]).items():
+            if isinstance(rendered, Exception):
+                frappe.log_error(str(rendered), f"Contract export failed: {name}")
+                failed.append((name, str(rendered)))
+                continue
+
+            html, css = rendered
+            file_url = get_cached_pdf(name, get_content_hash(html, css))
+            if file_url:
+                path = frappe.get_doc("File", {"file_url": file_url}).get_full_path()
+                if os.path.exists(path):
+                    yield name, path
+                    continue
+
+            yield name, html_to_pdf(html, css)
+
+
+def _write_zip(names):
+    fh = tempfile.TemporaryFile()
+    failed = []
+    with zipfile.ZipFile(fh, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, pdf in iter_contract_pdfs(names, failed):
+            arcname = f"Contract-{name}.pdf"
+            if isinstance(pdf, bytes):
+                archive.writestr(arcname, pdf)
+            else:
+                archive.write(pdf, arcname)
+
+        if failed:
+            archive.writestr("errors.txt", "\n".join(f"{name}: {error}" for name, error in failed) + "\n")
+    fh.seek(0)
+    return fh
+
+
+def _write_merged(names):
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        frappe.throw(_("Для объединенного PDF требуется библиотека pypdf, выберите ZIP"))
+
+    writer = PdfWriter()
+    failed = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i, (name, pdf) in enumerate(iter_contract_pdfs(names, failed)):
+            if isinstance(pdf, bytes):
+                path = os.path.join(tmpdir, f"{i}.pdf")
+                with open(path, "wb") as f:
+                    f.write(pdf)
+                pdf = path
+            writer.append(pdf)
+
+        if failed:
+            writer.close()
+            frappe.throw(_("Не удалось сформировать PDF договоров: {0}").format(
+                ", ".join(name for name, error in failed)
+            ))
+
+        fh = tempfile.TemporaryFile()
+        writer.write(fh)
+        writer.close()
+
+    fh.seek(0)
+    return fh
+
+
+def _stream(fh, filename, mimetype):
+    """Response streaming a temporary file; the file is deleted once sent"""
+    size = os.fstat(fh.fileno()).st_size
+    return Response(
+        wrap_file(frappe.local.request.environ, fh),
+        mimetype=mimetype,
+        direct_passthrough=True,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(size)
+        }
+    )
@@ -0,0 +1,273 @@
+"""
+Bulk Payments API for Nasiya365
+Applies batches of receipts (collector hand-ins, Click/Payme settlements)
+in one transaction with grouped reads and writes
+"""
+
+import frappe
+from frappe import _
+from frappe.model.naming import parse_naming_series
+from frappe.utils import cint, flt, getdate, now, today
+
+from nasiya365.nasiya365.doctype.installment_plan.installment_plan import allocate_payment
+from nasiya365.utils.due_index import OPEN_STATUSES, remove_installments
+
+
+# Must match the Payment Transaction autoname
+PAYMENT_SERIES = "PAY-.YYYY.-.#####"
+
+# Rows per multi-row UPDATE / INSERT statement
+WRITE_CHUNK_SIZE = 500
+
+PAYMENT_METHODS = ("Наличные", "Карта", "Click", "Payme", "Перевод")
+
+
+@frappe.whitelist(methods=["POST"])
+def apply_payments(payments):
+    """
+    Apply many payments in one transaction
+
+    Args:
+        payments: list (or JSON) of dicts with installment_plan and amount,
+            and optionally transaction_id, payment_method, payment_date,
+            collected_by and notes
+
+    Plans and their open schedule rows are read with one query each and
+    locked until commit; payments to the same plan are applied in the
+    given order. Payments whose transaction_id was already recorded are
+    skipped, so a settlement file can be re-sent safely.
+
+    Returns:
+        list: per payment, {"status": "applied", "payment_transaction",
+            "allocated", "excess"} or {"status": "skipped"/"error", "message"}
+    """
+    frappe.has_permission("Payment Transaction", "create", throw=True)
+
+    if isinstance(payments, str):
+        payments = frappe.parse_json(payments)
+
+    results = [None] * len(payments)
+    plans = _get_plans({p.get("installment_plan") for p in payments if p.get("installment_plan")})
+    schedules = _get_open_schedules(list(plans))
+    recorded = _get_recorded_transactions({p.get("transaction_id") for p in payments if p.get("transaction_id")})
+
+    paid_date = today()
+    transactions = []
+    touched_rows = {}
+    touched_plans = {}
+
+    for i, payment in enumerate(payments):
+        plan = plans.get(payment.get("installment_plan"))
+        amount = flt(payment.get("amount"))
+        transaction_id = payment.get("transaction_id")
+
+        if transaction_id and transaction_id in recorded:
+            results[i] = {"status": "skipped", "message": _("Транзакция {0} уже проведена").format(transaction_id)}
+            continue
+        error = _validate(payment, plan, amount)
+        if error:
+            results[i] = {"status": "error", "message": error}
+            continue
+
+        allocated, excess, changes = allocate_payment(
+            schedules.get(plan.name, []), amount, payment.get("payment_date") or paid_date
+        )
+        for row, old_status in changes:
+            plan.paid_installments += (row.status == "Оплачен") - (old_status == "Оплачен")
+            plan.overdue_installments += (row.status == "Просрочен") - (old_status == "Просрочен")
+            touched_rows[row.name] = row
+
+        plan.paid_amount = flt(plan.paid_amount) + allocated
+        plan.remaining_balance = flt(plan.total_amount) - plan.paid_amount
+        if plan.paid_installments >= plan.installments:
+            plan.status = "Завершен"
+        touched_plans[plan.name] = plan
+
+        if transaction_id:
+            recorded.add(transaction_id)
+        transactions.append((i, payment, plan, amount))
+        results[i] = {"status": "applied", "allocated": allocated, "excess": excess}
+
+    if not transactions:
+        return results
+
+    modified = now()
+    _update_plans(list(touched_plans.values()), modified)
+    _update_schedule_rows(list(touched_rows.values()), modified)
+    names = _insert_transactions(transactions, modified)
+    for (i, payment, plan, amount), name in zip(transactions, names):
+        results[i]["payment_transaction"] = name
+
+    closed = [name for name, row in touched_rows.items() if row.status not in OPEN_STATUSES]
+    if closed:
+        frappe.db.after_commit.add(lambda: remove_installments(closed))
+
+    return results
+
+
+def reserve_names(count):
+    """
+    Reserve `count` consecutive Payment Transaction names
+
+    Advances the same `tabSeries` counter as the doctype's autoname in one
+    locked read and one update, instead of one round trip per name. The
+    series key is built by Frappe's parse_naming_series from the parts
+    before the digits, exactly as make_autoname does.
+    """
+    *prefix_parts, digits = PAYMENT_SERIES.split(".")
+    prefix = parse_naming_series(prefix_parts)
+    digits = len(digits)
+
+    current = frappe.db.sql("SELECT current FROM `tabSeries` WHERE name = %s FOR UPDATE", prefix)
+    if current:
+        start = cint(current[0][0])
+        frappe.db.sql("UPDATE `tabSeries` SET current = %s WHERE name = %s", (start + count, prefix))
+    else:
+        start = 0
+        frappe.db.sql("INSERT INTO `tabSeries` (name, current) VALUES (%s, %s)", (prefix, count))
+
+    return [f"{prefix}{n:0{digits}d}" for n in range(start + 1, start + count + 1)]
+
+
+def _validate(payment, plan, amount):
+    if not plan:
+        return _("Рассрочка {0} не найдена").format(payment.get("installment_plan"))
+    if plan.docstatus == 0:
+        return _("Рассрочка {0} не проведена").format(plan.name)
+    if plan.docstatus == 2:
+        return _("Рассрочка {0} отменена").format(plan.name)
+    if plan.status == "Завершен":
+        return _("Рассрочка {0} уже погашена").format(plan.name)
+    if amount <= 0:
+        return _("Сумма платежа должна быть больше нуля")
+    if payment.get("payment_date"):
+        try:
+            payment["payment_date"] = getdate(payment.get("payment_date"))
+        except Exception:
+            # getdate throws; keep its message out of this request's response
+            frappe.clear_last_message()
+            return _("Неверная дата платежа {0}").format(payment.get("payment_date"))
+    if payment.get("payment_method") and payment.get("payment_method") not in PAYMENT_METHODS:
+        return _("Неизвестный метод оплаты {0}").format(payment.get("payment_method"))
+
+
+def _get_plans(names):
+    if not names:
+        return {}
+
+    plans = frappe.db.sql("""
+        SELECT
+            ip.name, ip.customer, ip.docstatus, ip.status, ip.total_amount,
+            ip.paid_amount, ip.paid_installments, ip.overdue_installments,
+            (SELECT COUNT(*) FROM `tabInstallment Schedule` isc WHERE isc.parent = ip.name) as installments
+        FROM `tabInstallment Plan` ip
+        WHERE ip.name IN %(names)s
+        FOR UPDATE
+    """, {"names": tuple(names)}, as_dict=True)
+
+    for plan in plans:
+        plan.paid_installments = cint(plan.paid_installments)
+        plan.overdue_installments = cint(plan.overdue_installments)
+
+    return {plan.name: plan for plan in plans}
+
+
+def _get_open_schedules(plan_names):
+    """Unpaid schedule rows of all plans in one query, grouped by plan"""
+    if not plan_names:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT name, parent, due_date, amount, paid_amount, status, paid_date
+        FROM `tabInstallment Schedule`
+        WHERE parent IN %(plans)s
+        AND parenttype = 'Installment Plan'
+        AND status IN ('Ожидает', 'Просрочен', 'Частично')
+        ORDER BY parent, due_date, idx
+        FOR UPDATE
+    """, {"plans": tuple(plan_names)}, as_dict=True)
+
+    schedules = {}
+    for row in rows:
+        schedules.setdefault(row.parent, []).append(row)
+    return schedules
+
+
+def _get_recorded_transactions(transaction_ids):
+    if not transaction_ids:
+        return set()
+
+    return set(frappe.db.sql_list("""
+        SELECT transaction_id FROM `tabPayment Transaction`
+        WHERE transaction_id IN %(ids)s AND docstatus < 2
+    """, {"ids": tuple(transaction_ids)}))
+
+
+def _update_plans(plans, modified):
+    for chunk in _chunks(plans):
+        _update_cases("Installment Plan", chunk, {
+            "paid_amount": lambda p: flt(p.paid_amount),
+            "remaining_balance": lambda p: flt(p.remaining_balance),
+            "paid_installments": lambda p: p.paid_installments,
+            "overdue_installments": lambda p: p.overdue_installments,
+            "status": lambda p: p.status,
+        }, modified)
+
+
+def _update_schedule_rows(rows, modified):
+    for chunk in _chunks(rows):
+        _update_cases("Installment Schedule", chunk, {
+            "paid_amount": lambda r: flt(r.paid_amount),
+            "status": lambda r: r.status,
+            "paid_date": lambda r: r.paid_date,
+        }, modified)
+
+
+def _update_cases(doctype, records, fields, modified):
+    """One UPDATE setting per-record values with CASE name ... END"""
+    values = {"names": tuple(r.name for r in records), "modified": modified, "user": frappe.session.user}
+    assignments = []
+
+    for fieldname, get_value in fields.items():
+        cases = []
+        for i, record in enumerate(records):
+            values[f"n{i}"] = record.name
+            values[f"{fieldname}_{i}"] = get_value(record)
+            cases.append(f"WHEN %(n{i})s THEN %({fieldname}_{i})s")
+        assignments.append(f"`{fieldname}` = CASE name {' '.join(cases)} ELSE `{fieldname}` END")
+
+    frappe.db.sql(f"""
+        UPDATE `tab{doctype}`
+        SET {', '.join(assignments)}, modified = %(modified)s, modified_by = %(user)s
+        WHERE name IN %(names)s
+    """, values)
+
+
+def _insert_transactions(transactions, modified):
+    """Insert one completed Payment Transaction per applied payment"""
+    names = reserve_names(len(transactions))
+    user = frappe.session.user
+    fields = [
+        "name", "creation", "modified", "modified_by", "owner", "docstatus",
+        "customer", "payment_date", "amount", "status", "payment_method",
+        "transaction_id", "collected_by", "reference_doctype", "reference_name",
+        "received_by", "notes"
+    ]
+
+    values = []
+    for name, (i, payment, plan, amount) in zip(names, transactions):
+        values.append((
+            name, modified, modified, user, user, 0,
+            plan.customer, payment.get("payment_date") or today(), amount, "Завершен",
+            payment.get("payment_method") or "Наличные", payment.get("transaction_id"),
+            payment.get("collected_by"), "Installment Plan", plan.name,
+            user, payment.get("notes")
+        ))
+
+    frappe.db.bulk_insert("Payment Transaction", fields, values, chunk_size=WRITE_CHUNK_SIZE)
+    return names
+
+
+def _chunks(items):
+    for i in range(0, len(items), WRITE_CHUNK_SIZE):
+        yield items[i:i + WRITE_CHUNK_SIZE]
@@ -0,0 +1,201 @@
+"""
+Provider Callbacks for Nasiya365
+Delivery receipts are buffered in Redis and applied to SMS Messages in bulk
+"""
+
+import hmac
+import json
+
+import frappe
+from frappe.utils import get_datetime, now_datetime
+
+
+BUFFER_KEY = "nasiya365:sms_status_buffer"
+FLUSH_MARKER_KEY = "nasiya365:sms_status_flush"
+
+# At most one flush job is enqueued per interval while receipts keep coming
+FLUSH_INTERVAL = 5
+
+# Receipts applied per UPDATE statement
+FLUSH_BATCH_SIZE = 1000
+
+DELIVERED_STATUSES = {"DELIVRD", "DELIVERED"}
+FAILED_STATUSES = {"UNDELIV", "UNDELIVERABLE", "REJECTD", "REJECTED", "EXPIRED", "DELETED", "NOT_DELIVERED"}
+
+# SMS Message states no receipt may move a message out of
+FINAL_STATES = ("Доставлено", "Не доставлено", "Ошибка")
+
+
+@frappe.whitelist(allow_guest=True, methods=["POST"])
+def sms_status(**kwargs):
+    """
+    Delivery status webhook for Eskiz and Playmobile
+
+    Only buffers the receipts; flush_sms_status applies them. Refused
+    unless nasiya365_sms_callback_secret is set and passed as `token`.
+    """
+    secret = frappe.conf.get("nasiya365_sms_callback_secret")
+    if not secret:
+        frappe.throw("SMS callbacks are disabled: nasiya365_sms_callback_secret is not set", frappe.PermissionError)
+
+    token = frappe.form_dict.get("token") or ""
+    if not hmac.compare_digest(str(token).encode(), str(secret).encode()):
+        frappe.throw("Invalid callback token", frappe.PermissionError)
+
+    receipts = _parse_receipts(frappe.form_dict)
+    if not receipts:
+        return {"status": "ignored"}
+
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.rpush(cache.make_key(BUFFER_KEY), *[json.dumps(r) for r in receipts])
+    # SET NX with a short expiry: the first receipt in each interval schedules a flush
+    pipe.set(cache.make_key(FLUSH_MARKER_KEY), 1, nx=True, ex=FLUSH_INTERVAL)
+    _, schedule_flush = pipe.execute()
+
+    if schedule_flush:
+        frappe.enqueue(
+            "nasiya365.callbacks.flush_sms_status",
+            queue="short",
+            job_id="nasiya365_sms_status_flush",
+            deduplicate=True
+        )
+
+    return {"status": "ok"}
+
+
+def get_callback_url():
+    """
+    Callback URL registered with the provider, carrying the shared secret;
+    without nasiya365_sms_callback_secret the endpoint refuses receipts
+    """
+    url = frappe.utils.get_url("/api/method/nasiya365.callbacks.sms_status")
+    secret = frappe.conf.get("nasiya365_sms_callback_secret")
+    return f"{url}?token={secret}" if secret else url
+
+
+def flush_sms_status():
+    """
+    Apply buffered delivery receipts to SMS Messages.
+    Enqueued by the webhook and run every minute as a safety net.
+    """
+    cache = frappe.cache()
+    key = cache.make_key(BUFFER_KEY)
+    applied = 0
+
+    while True:
+        pipe = cache.pipeline()
+        pipe.lrange(key, 0, FLUSH_BATCH_SIZE - 1)
+        pipe.ltrim(key, FLUSH_BATCH_SIZE, -1)
+        raw, _ = pipe.execute()
+        if not raw:
+            break
+
+        applied += apply_receipts([json.loads(frappe.safe_decode(r)) for r in raw])
+        frappe.db.commit()
+
+        if len(raw) < FLUSH_BATCH_SIZE:
+            break
+
+    if applied:
+        frappe.logger().info(f"Applied {applied} SMS delivery receipts")
+
+
+def apply_receipts(receipts):
+    """
+    Update SMS Messages from a batch of receipts with one UPDATE
+
+    Receipts reference our SMS Message name (user_sms_id / message-id) or,
+    for messages sent one by one, the provider's message id. When a message
+    has several receipts in the batch, the last final one (delivered or
+    failed) wins over intermediate ones. Messages already in a final state
+    are left alone, so late or repeated receipts never move a status back.
+    """
+    by_provider_id = [r["provider_message_id"] for r in receipts if not r.get("name") and r.get("provider_message_id")]
+    names_by_provider_id = {}
+    if by_provider_id:
+        names_by_provider_id = dict(frappe.db.sql("""
+            SELECT provider_message_id, name
+            FROM `tabSMS Message`
+            WHERE provider_message_id IN %(ids)s
+        """, {"ids": tuple(by_provider_id)}))
+
+    updates = {}
+    for receipt in receipts:
+        name = receipt.get("name") or names_by_provider_id.get(receipt.get("provider_message_id"))
+        if not name:
+            continue
+        if (name in updates and _map_status(receipt.get("status")) == "Отправлено"
+                and _map_status(updates[name].get("status")) != "Отправлено"):
+            # An intermediate receipt arriving after a final one
+            continue
+        updates[name] = receipt
+
+    if not updates:
+        return 0
+
+    status_cases, raw_cases, delivered_cases = [], [], []
+    values = {"names": tuple(updates), "final_states": FINAL_STATES}
+    for i, (name, receipt) in enumerate(updates.items()):
+        values[f"n{i}"] = name
+        values[f"s{i}"] = _map_status(receipt.get("status"))
+        values[f"r{i}"] = (receipt.get("status") or "")[:140]
+        values[f"d{i}"] = receipt.get("delivered_at")
+        status_cases.append(f"WHEN %(n{i})s THEN %(s{i})s")
+        raw_cases.append(f"WHEN %(n{i})s THEN %(r{i})s")
+        delivered_cases.append(f"WHEN %(n{i})s THEN COALESCE(%(d{i})s, delivered_at)")
+
+    frappe.db.sql(f"""
+        UPDATE `tabSMS Message`
+        SET
+            status = CASE name {" ".join(status_cases)} ELSE status END,
+            delivery_status = CASE name {" ".join(raw_cases)} ELSE delivery_status END,
+            delivered_at = CASE name {" ".join(delivered_cases)} ELSE delivered_at END
+        WHERE name IN %(names)s
+        AND status NOT IN %(final_states)s
+    """, values)
+
+    return len(updates)
+
+
+def _map_status(provider_status):
+    status = (provider_status or "").upper()
+    if status in DELIVERED_STATUSES:
+        return "Доставлено"
+    if status in FAILED_STATUSES:
+        return "Не доставлено"
+    return "Отправлено"
+
+
+def _parse_receipts(data):
+    """Normalize Eskiz (flat) and Playmobile (list under "messages") payloads"""
+    items = data.get("messages")
+    if isinstance(items, str):
+        items = frappe.parse_json(items)
+    if not isinstance(items, list):
+        items = [data]
+
+    receipts = []
+    for item in items:
+        name = item.get("user_sms_id") or item.get("message-id")
+        provider_message_id = item.get("message_id") or item.get("id")
+        status = item.get("status")
+        if not status or not (name or provider_message_id):
+            continue
+
+        delivered_at = None
+        if _map_status(status) == "Доставлено":
+            status_date = item.get("status_date") or item.get("delivered-date")
+            try:
+                delivered_at = str(get_datetime(status_date) if status_date else now_datetime())
+            except Exception:
+                delivered_at = str(now_datetime())
+
+        receipts.append({
+            "name": name,
+            "provider_message_id": str(provider_message_id) if provider_message_id else None,
+            "status": str(status),
+            "delivered_at": delivered_at
+        })
+
+    return receipts
@@ -5,6 +5,8 @@ import csv
 import os
 import re
 
+from nasiya365.utils.phone import find_customer_by_phone, normalize_phone
+
 
 class SkipRow(Exception):
     """Raised when a row should be skipped (empty/invalid) without counting as success or error."""
@@ -142,7 +144,7 @@ def process_customer_row(row, summary, skip_validation=False):
     # Check if customer exists by phone
     existing_customer = None
     for p in phones:
-        existing = frappe.db.get_value("Customer Phone Number", {"phone_number": p}, "parent")
+        existing = find_customer_by_phone(p)
         if existing:
             existing_customer = frappe.get_doc("Customer Profile", existing)
             summary["duplicates"] += 1
@@ -194,11 +196,7 @@ def process_customer_row(row, summary, skip_validation=False):
 
     # Phone Numbers (each entry in phones is already cleaned; add separately)
     if not existing_customer:
-        for i, p in enumerate(phones):
-            customer.append("phone_numbers", {
-                "phone_number": p,
-                "is_primary": 1 if i == 0 else 0
-            })
+        append_phone_numbers(customer, phones)
             
     customer.flags.ignore_permissions = True
     if skip_validation:
@@ -335,7 +333,7 @@ def get_or_create_customer(name, phone, skip_validation=False):
     
     if phones:
         for p in phones:
-            existing = frappe.db.get_value("Customer Phone Number", {"phone_number": p}, "parent")
+            existing = find_customer_by_phone(p)
             if existing:
                 return frappe.get_doc("Customer Profile", existing)
     
@@ -348,11 +346,7 @@ def get_or_create_customer(name, phone, skip_validation=False):
     customer.last_name = last_name
     customer.status = "Active"
     
-    for i, p in enumerate(phones):
-        customer.append("phone_numbers", {
-            "phone_number": p,
-            "is_primary": 1 if i == 0 else 0
-        })
+    append_phone_numbers(customer, phones)
 
     customer.flags.ignore_permissions = True
     if skip_validation:
@@ -450,6 +444,24 @@ def clean_phone(val):
     return re.sub(r"[^0-9+]", "", val)
 
 
+def append_phone_numbers(customer, phones):
+    """Add phones to a new customer, first one primary, skipping numbers that
+    normalize to one already added. phone_normalized is set here because
+    imports may skip validation."""
+    seen = set()
+    for p in phones:
+        normalized = normalize_phone(p)
+        if normalized in seen:
+            continue
+        if normalized:
+            seen.add(normalized)
+        customer.append("phone_numbers", {
+            "phone_number": p,
+            "phone_normalized": normalized,
+            "is_primary": 0 if customer.phone_numbers else 1
+        })
+
+
 def parse_phone_list(raw):
     """Split comma/semicolon-separated phone string into list of non-empty cleaned numbers (unique)."""
     if not raw or not str(raw).strip():
@@ -65,6 +65,13 @@ jinja = {
     "methods": [
         "nasiya365.utils.jinja_filters.currency_format",
         "nasiya365.utils.jinja_filters.date_format",
+        "nasiya365.utils.jinja_filters.phone_format",
+        "nasiya365.utils.jinja_filters.passport_format",
+    ],
+    "filters": [
+        "nasiya365.utils.jinja_filters.currency_format",
+        "nasiya365.utils.jinja_filters.date_format",
+        "nasiya365.utils.jinja_filters.phone_format",
     ]
 }
 
@@ -110,13 +117,23 @@ scheduler_events = {
     # Run every hour
     "hourly": [
         "nasiya365.tasks.hourly.sync_payment_status",
+        "nasiya365.tasks.hourly.flag_new_overdue",
     ],
     # Run every week
     "weekly": [
         "nasiya365.tasks.weekly.generate_collection_report",
     ],
+    # Run every month
+    "monthly": [
+        "nasiya365.tasks.statements.generate_monthly_statements",
+    ],
     # Cron-style scheduling
     "cron": {
+        # Every minute - deliver queued SMS messages, apply delivery receipts
+        "* * * * *": [
+            "nasiya365.tasks.notifications.process_sms_queue",
+            "nasiya365.callbacks.flush_sms_status"
+        ],
         # Every day at 9 AM - send payment reminders
         "0 9 * * *": [
             "nasiya365.tasks.notifications.send_due_today_reminders"
@@ -41,28 +41,16 @@ class Contract(Document):
         if not self.template:
             frappe.throw(_("Пожалуйста, выберите шаблон печати"))
         
-        from nasiya365.utils.pdf import generate_contract_pdf
-        pdf_content = generate_contract_pdf(self.name)
+        from nasiya365.utils.pdf import get_contract_pdf
         
-        if pdf_content:
-            # Save PDF as attachment
-            file_name = f"Contract-{self.name}.pdf"
-            file_doc = frappe.get_doc({
-                "doctype": "File",
-                "file_name": file_name,
-                "attached_to_doctype": "Contract",
-                "attached_to_name": self.name,
-                "content": pdf_content,
-                "is_private": 1
-            })
-            file_doc.insert()
-            
-            self.pdf_file = file_doc.file_url
+        # Reuses the attached PDF when the rendered content is unchanged
+        file_url = get_contract_pdf(self.name)
+        
+        if file_url and file_url != self.pdf_file:
+            self.pdf_file = file_url
             self.save()
-            
-            return file_doc.file_url
         
-        return None
+        return file_url
 
 
 @frappe.whitelist()
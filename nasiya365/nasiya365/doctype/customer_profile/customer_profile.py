@@ -9,6 +9,8 @@ from frappe.model.document import Document
 from frappe.utils import getdate, today, date_diff
 import re
 
+from nasiya365.utils.phone import find_customer_by_phone, normalize_phone
+
 
 class CustomerProfile(Document):
     def validate(self):
@@ -32,6 +34,37 @@ class CustomerProfile(Document):
         
         if primary_count > 1:
             frappe.throw(_("Only one phone number can be marked as Primary/Main"))
+        
+        self.validate_unique_phones()
+    
+    def validate_unique_phones(self):
+        """Set phone_normalized on each number and reject numbers already in use"""
+        seen = set()
+        for phone in self.phone_numbers:
+            phone.phone_normalized = normalize_phone(phone.phone_number)
+            if not phone.phone_normalized:
+                continue
+            
+            if phone.phone_normalized in seen:
+                frappe.throw(_("Phone number {0} is entered twice").format(phone.phone_number))
+            seen.add(phone.phone_normalized)
+        
+        if not seen:
+            return
+        
+        taken = frappe.db.get_all("Customer Phone Number",
+            filters={
+                "phone_normalized": ["in", list(seen)],
+                "parenttype": "Customer Profile",
+                "parent": ["!=", self.name or ""]
+            },
+            fields=["phone_normalized", "parent"],
+            limit=1
+        )
+        if taken:
+            frappe.throw(_("Phone number {0} already belongs to customer {1}").format(
+                taken[0].phone_normalized, taken[0].parent
+            ))
     
     def validate_passport(self):
         """Validate passport format"""
@@ -85,27 +118,14 @@ class CustomerProfile(Document):
 
 @frappe.whitelist()
 def get_customer_by_phone(phone):
-    """API endpoint to find customer by phone number"""
-    # Normalize phone format
-    clean_phone = re.sub(r'[\s\-]', '', phone)
-    
-    # Search in Customer Phone Number child table
-    phone_records = frappe.db.get_all("Customer Phone Number", 
-        filters={
-            "phone_number": ["in", [phone, f"+998{clean_phone}", clean_phone]]
-        },
-        fields=["parent"]
-    )
+    """API endpoint to find customer by phone number, in any format"""
+    customer_name = find_customer_by_phone(phone)
     
-    if phone_records:
-        customer_name = phone_records[0].parent
-        customer = frappe.get_doc("Customer Profile", customer_name)
-        return {
-            "name": customer.name,
-            "first_name": customer.first_name,
-            "last_name": customer.last_name,
-            "phone": customer.get_primary_phone(),
-            "status": customer.status
-        }
+    if customer_name:
+        customer = frappe.db.get_value("Customer Profile", customer_name,
+            ["name", "first_name", "last_name", "status"], as_dict=True)
+        customer.phone = frappe.db.get_value("Customer Phone Number",
+            {"parent": customer_name, "parenttype": "Customer Profile", "is_primary": 1}, "phone_number")
+        return customer
     
     return None
@@ -3,12 +3,19 @@ Installment Plan DocType Controller
 Core BNPL logic for managing customer installment plans
 """
 
+import copy
+from functools import lru_cache
+
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import add_days, add_months, add_to_date, getdate, today, flt
+from frappe.utils import add_days, cint, cstr, get_datetime, getdate, now, today, flt
 from decimal import Decimal
 
+from nasiya365.utils.amortization import amortize, get_method
+from nasiya365.utils.due_index import OPEN_STATUSES, index_schedule, remove_installments
+from nasiya365.utils.schedule_dates import get_due_dates, get_non_working_days
+
 
 class InstallmentPlan(Document):
     def validate(self):
@@ -18,17 +25,25 @@ class InstallmentPlan(Document):
         self.validate_customer_limit()
         self.calculate_amounts()
         self.generate_schedule()
+        
         self.update_progress()
     
     def before_insert(self):
         self.created_by = frappe.session.user
     
+    def on_update(self):
+        index_schedule(self)
+    
     def on_submit(self):
         self.update_customer_limit()
         self.create_contract()
     
     def on_cancel(self):
         self.release_customer_limit()
+        index_schedule(self)
+    
+    def on_trash(self):
+        remove_installments([row.name for row in self.schedule])
     
     def validate_customer_limit(self):
         """Check if customer has sufficient credit limit"""
@@ -47,26 +62,20 @@ class InstallmentPlan(Document):
                 )
     
     def calculate_amounts(self):
-        """Calculate total interest 、, financed amount, and installment amount"""
-        principal = flt(self.principal_amount)
-        down_payment = flt(self.down_payment)
-        interest_rate = flt(self.interest_rate) / 100  # Monthly rate
-        num_installments = int(self.number_of_installments)
-        
+        """Calculate total interest, financed amount, and installment amount"""
         # Financed amount is principal minus down payment
-        self.financed_amount = principal - down_payment
-        
-        # Calculate total interest (simple interest for now)
-        self.total_interest = self.financed_amount * interest_rate * num_installments
-        
-        # Total amount including interest
-        self.total_amount = self.financed_amount + self.total_interest
+        self._amortization = amortize(
+            flt(self.principal_amount) - flt(self.down_payment),
+            flt(self.interest_rate) / 100,  # Rate per installment
+            int(self.number_of_installments),
+            get_method(self.interest_method),
+            self.precision("installment_amount")
+        )
         
-        # Equal installment amount
-        if num_installments > 0:
-            self.installment_amount = self.total_amount / num_installments
-        else:
-            self.installment_amount = self.total_amount
+        self.financed_amount = flt(self._amortization["financed_amount"])
+        self.total_interest = flt(self._amortization["total_interest"])
+        self.total_amount = flt(self._amortization["total_amount"])
+        self.installment_amount = flt(self._amortization["installment_amount"])
         
         # Calculate remaining balance
         self.remaining_balance = self.total_amount - flt(self.paid_amount)
@@ -76,22 +85,16 @@ class InstallmentPlan(Document):
         if not self.schedule or len(self.schedule) != self.number_of_installments:
             self.schedule = []
             
-            current_date = getdate(self.start_date)
+            rows = self._amortization["rows"]
+            due_dates = get_due_dates(self.start_date, self.frequency, self.number_of_installments)
             
-            for i in range(self.number_of_installments):
-                # Calculate due date based on frequency
-                if i > 0:
-                    if self.frequency == "Еженедельно":
-                        current_date = add_to_date(current_date, weeks=1)
-                    elif self.frequency == "Раз в две недели":
-                        current_date = add_to_date(current_date, weeks=2)
-                    else:  # Monthly
-                        current_date = add_months(current_date, 1)
-                
+            for i, due_date in enumerate(due_dates):
                 self.append("schedule", {
                     "installment_number": i + 1,
-                    "due_date": current_date,
-                    "amount": self.installment_amount,
+                    "due_date": due_date,
+                    "amount": flt(rows[i]["amount"]),
+                    "principal_amount": flt(rows[i]["principal"]),
+                    "interest_amount": flt(rows[i]["interest"]),
                     "status": "Ожидает",
                     "paid_amount": 0
                 })
@@ -103,8 +106,50 @@ class InstallmentPlan(Document):
     def update_progress(self):
         """Update progress counters"""
         if self.schedule:
-            self.paid_installments = len([s for s in self.schedule if s.status == "Оплачен"])
-            self.overdue_installments = len([s for s in self.schedule if s.status == "Просрочен"])
+            paid = overdue = 0
+            for s in self.schedule:
+                if s.status == "Оплачен":
+                    paid += 1
+                elif s.status == "Просрочен":
+                    overdue += 1
+            self.paid_installments = paid
+            self.overdue_installments = overdue
+    
+    def update_progress_for_row(self, old_status, new_status):
+        """Adjust progress counters for one schedule row changing status"""
+        if old_status == new_status:
+            return
+        
+        if old_status == "Оплачен":
+            self.paid_installments = cint(self.paid_installments) - 1
+        elif old_status == "Просрочен":
+            self.overdue_installments = cint(self.overdue_installments) - 1
+        
+        if new_status == "Оплачен":
+            self.paid_installments = cint(self.paid_installments) + 1
+        elif new_status == "Просрочен":
+            self.overdue_installments = cint(self.overdue_installments) + 1
+    
+    def get_progress_mismatches(self):
+        """
+        Compare the stored counters and totals with a full recomputation
+        
+        Returns:
+            dict: fieldname -> (stored, expected) for every counter that is off
+        """
+        expected = {
+            "paid_installments": len([s for s in self.schedule if s.status == "Оплачен"]),
+            "overdue_installments": len([s for s in self.schedule if s.status == "Просрочен"]),
+            "paid_amount": flt(sum(flt(s.paid_amount) for s in self.schedule), self.precision("paid_amount")),
+        }
+        
+        mismatches = {}
+        for fieldname, value in expected.items():
+            stored = flt(self.get(fieldname), self.precision(fieldname))
+            if stored != value:
+                mismatches[fieldname] = (stored, value)
+        
+        return mismatches
     
     def update_customer_limit(self):
         """Reduce customer's available limit when plan is submitted"""
@@ -127,87 +172,246 @@ class InstallmentPlan(Document):
         """
         Apply a payment to this installment plan
         Automatically allocates to oldest pending/overdue installments first
+        
+        Only the touched schedule rows and the plan totals are written, with
+        targeted UPDATEs in the current transaction; the plan is not saved.
+        Raises frappe.TimestampMismatchError if the plan changed since it
+        was loaded.
         """
-        remaining_payment = flt(amount)
-        
-        # Sort schedule by due date
-        sorted_schedule = sorted(self.schedule, key=lambda x: x.due_date)
-        
-        for installment in sorted_schedule:
-            if installment.status in ["Ожидает", "Просрочен", "Частично"]:
-                due_amount = flt(installment.amount) - flt(installment.paid_amount)
-                
-                if remaining_payment >= due_amount:
-                    # Full payment for this installment
-                    installment.paid_amount = installment.amount
-                    installment.status = "Оплачен"
-                    installment.paid_date = today()
-                    remaining_payment -= due_amount
-                elif remaining_payment > 0:
-                    # Partial payment
-                    installment.paid_amount = flt(installment.paid_amount) + remaining_payment
-                    installment.status = "Частично"
-                    remaining_payment = 0
-                
-                if remaining_payment <= 0:
-                    break
+        allocated, remaining_payment, changes = allocate_payment(self.schedule, amount)
         
-        # Update totals
-        self.paid_amount = sum(flt(s.paid_amount) for s in self.schedule)
+        touched = []
+        for installment, old_status in changes:
+            self.update_progress_for_row(old_status, installment.status)
+            touched.append(installment)
+        
+        # Update totals from the allocated amount only
+        self.paid_amount = flt(self.paid_amount) + allocated
         self.remaining_balance = self.total_amount - self.paid_amount
-        self.update_progress()
+        
+        if frappe.conf.get("nasiya365_audit_plan_counters"):
+            mismatches = self.get_progress_mismatches()
+            if mismatches:
+                frappe.log_error(
+                    f"Progress counters of {self.name} out of sync: {mismatches}",
+                    "Installment Plan Audit"
+                )
+                self.update_progress()
+                self.paid_amount = sum(flt(s.paid_amount) for s in self.schedule)
+                self.remaining_balance = self.total_amount - self.paid_amount
         
         # Check if plan is completed
-        if all(s.status == "Оплачен" for s in self.schedule):
+        if cint(self.paid_installments) >= len(self.schedule):
             self.status = "Завершен"
         
-        self.save()
-        
-        # Update customer statistics
-        frappe.get_doc("Customer Profile", self.customer).update_statistics()
+        self.db_update_payment(touched)
         
         return remaining_payment  # Return any excess payment
+    
+    def db_update_payment(self, rows):
+        """
+        Write the plan totals and the given schedule rows
+        
+        The plan row is locked and its `modified` compared with the loaded
+        one first, like Document.check_if_latest, so a concurrent payment,
+        edit or overdue flip makes this one fail instead of silently
+        overwriting it. The lock is held until commit.
+        """
+        current = frappe.db.sql(
+            "SELECT modified FROM `tabInstallment Plan` WHERE name = %s FOR UPDATE", self.name
+        )
+        if not current or cstr(get_datetime(current[0][0])) != cstr(get_datetime(self.modified)):
+            frappe.throw(
+                _("Рассрочка {0} была изменена другим пользователем. Обновите документ и повторите платеж.").format(self.name),
+                frappe.TimestampMismatchError
+            )
+        
+        modified = now()
+        
+        frappe.db.sql("""
+            UPDATE `tabInstallment Plan`
+            SET
+                paid_amount = %(paid_amount)s,
+                remaining_balance = %(remaining_balance)s,
+                paid_installments = %(paid_installments)s,
+                overdue_installments = %(overdue_installments)s,
+                status = %(status)s,
+                modified = %(modified)s,
+                modified_by = %(user)s
+            WHERE name = %(name)s
+        """, {
+            "paid_amount": flt(self.paid_amount),
+            "remaining_balance": flt(self.remaining_balance),
+            "paid_installments": cint(self.paid_installments),
+            "overdue_installments": cint(self.overdue_installments),
+            "status": self.status,
+            "modified": modified,
+            "user": frappe.session.user,
+            "name": self.name
+        })
+        
+        for row in rows:
+            frappe.db.sql("""
+                UPDATE `tabInstallment Schedule`
+                SET paid_amount = %(paid_amount)s, status = %(status)s, paid_date = %(paid_date)s, modified = %(modified)s
+                WHERE name = %(name)s
+            """, {
+                "paid_amount": flt(row.paid_amount),
+                "status": row.status,
+                "paid_date": row.paid_date,
+                "modified": modified,
+                "name": row.name
+            })
+        
+        self.modified = modified
+        
+        # Rows that can no longer turn overdue leave the due-date index, once the payment is committed
+        closed = [row.name for row in rows if row.status not in OPEN_STATUSES]
+        if closed:
+            frappe.db.after_commit.add(lambda: remove_installments(closed))
+
+
+def allocate_payment(schedule, amount, paid_date=None):
+    """
+    Allocate a payment to the oldest pending/overdue installments first
+    
+    Updates paid_amount, status and paid_date on the rows in place; works on
+    schedule child documents as well as plain row dicts.
+    
+    Returns:
+        tuple: (allocated amount, excess amount, [(row, previous status)] for
+            every row the payment touched)
+    """
+    remaining_payment = flt(amount)
+    allocated = 0
+    changes = []
+    
+    # Sort schedule by due date
+    sorted_schedule = sorted(schedule, key=lambda x: x.due_date)
+    
+    for installment in sorted_schedule:
+        if installment.status in ["Ожидает", "Просрочен", "Частично"]:
+            old_status = installment.status
+            due_amount = flt(installment.amount) - flt(installment.paid_amount)
+            
+            if remaining_payment >= due_amount:
+                # Full payment for this installment
+                installment.paid_amount = installment.amount
+                installment.status = "Оплачен"
+                installment.paid_date = paid_date or today()
+                remaining_payment -= due_amount
+                allocated += due_amount
+            elif remaining_payment > 0:
+                # Partial payment; an overdue installment stays overdue
+                installment.paid_amount = flt(installment.paid_amount) + remaining_payment
+                if installment.status != "Просрочен":
+                    installment.status = "Частично"
+                allocated += remaining_payment
+                remaining_payment = 0
+            
+            changes.append((installment, old_status))
+            
+            if remaining_payment <= 0:
+                break
+    
+    return allocated, remaining_payment, changes
 
 
 @frappe.whitelist()
-def calculate_installment_preview(principal, down_payment, interest_rate, num_installments, frequency, start_date):
+def audit_progress_counters(plan_names=None):
+    """
+    Consistency check for incrementally maintained plan counters
+    
+    Recomputes paid/overdue counts and paid totals for the given plans
+    (or all submitted plans) in one grouped query and returns the plans
+    whose stored values differ.
+    """
+    frappe.only_for(["System Manager", "Nasiya365 Admin"])
+    
+    if isinstance(plan_names, str):
+        plan_names = frappe.parse_json(plan_names)
+    
+    conditions = "ip.docstatus = 1"
+    values = {}
+    if plan_names:
+        conditions = "ip.name IN %(plan_names)s"
+        values["plan_names"] = tuple(plan_names)
+    
+    rows = frappe.db.sql(f"""
+        SELECT
+            ip.name,
+            ip.paid_installments,
+            ip.overdue_installments,
+            ip.paid_amount,
+            SUM(isc.status = 'Оплачен') as expected_paid_installments,
+            SUM(isc.status = 'Просрочен') as expected_overdue_installments,
+            SUM(IFNULL(isc.paid_amount, 0)) as expected_paid_amount
+        FROM `tabInstallment Plan` ip
+        INNER JOIN `tabInstallment Schedule` isc ON isc.parent = ip.name
+        WHERE {conditions}
+        GROUP BY ip.name
+    """, values, as_dict=True)
+    
+    mismatches = []
+    for row in rows:
+        if (
+            cint(row.paid_installments) != cint(row.expected_paid_installments)
+            or cint(row.overdue_installments) != cint(row.expected_overdue_installments)
+            or flt(row.paid_amount, 2) != flt(row.expected_paid_amount, 2)
+        ):
+            mismatches.append(row)
+    
+    return mismatches
+
+
+@frappe.whitelist()
+def calculate_installment_preview(principal, down_payment, interest_rate, num_installments, frequency, start_date,
+                                  interest_method=None):
     """
     API endpoint to preview installment calculation before creating plan
+    
+    Called while the user types, so results are cached per worker by the
+    normalized inputs.
     """
-    principal = flt(principal)
-    down_payment = flt(down_payment)
-    interest_rate = flt(interest_rate) / 100
-    num_installments = int(num_installments)
+    result = _calculate_preview(
+        flt(principal, 2),
+        flt(down_payment, 2),
+        flt(interest_rate, 6),
+        cint(num_installments),
+        frequency or "",
+        str(getdate(start_date)),
+        get_method(interest_method),
+        get_non_working_days()
+    )
     
-    financed = principal - down_payment
-    total_interest = financed * interest_rate * num_installments
-    total_amount = financed + total_interest
-    installment_amount = total_amount / num_installments if num_installments > 0 else total_amount
+    # Callers get their own copy of the cached result
+    return copy.deepcopy(result)
+
+
+@lru_cache(maxsize=2048)
+def _calculate_preview(principal, down_payment, interest_rate, num_installments, frequency, start_date,
+                       method, non_working_days):
+    result = amortize(principal - down_payment, interest_rate / 100, num_installments, method)
     
     # Generate schedule preview
     schedule = []
-    current_date = getdate(start_date)
+    due_dates = get_due_dates(start_date, frequency, num_installments, non_working_days)
     
-    for i in range(num_installments):
-        if i > 0:
-            if frequency == "Еженедельно":
-                current_date = add_to_date(current_date, weeks=1)
-            elif frequency == "Раз в две недели":
-                current_date = add_to_date(current_date, weeks=2)
-            else:
-                current_date = add_months(current_date, 1)
-        
+    for i, due_date in enumerate(due_dates):
+        row = result["rows"][i]
         schedule.append({
             "installment_number": i + 1,
-            "due_date": str(current_date),
-            "amount": installment_amount
+            "due_date": str(due_date),
+            "amount": flt(row["amount"]),
+            "principal_amount": flt(row["principal"]),
+            "interest_amount": flt(row["interest"])
         })
     
     return {
-        "financed_amount": financed,
-        "total_interest": total_interest,
-        "total_amount": total_amount,
-        "installment_amount": installment_amount,
-        "end_date": str(current_date) if schedule else None,
+        "financed_amount": flt(result["financed_amount"]),
+        "total_interest": flt(result["total_interest"]),
+        "total_amount": flt(result["total_amount"]),
+        "installment_amount": flt(result["installment_amount"]),
+        "end_date": str(due_dates[-1]) if due_dates else None,
         "schedule": schedule
     }
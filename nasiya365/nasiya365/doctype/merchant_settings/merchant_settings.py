@@ -6,11 +6,14 @@ Single DocType for tenant-specific settings
 import frappe
 from frappe.model.document import Document
 
+from nasiya365.utils.schedule_dates import parse_holidays
+
 
 class MerchantSettings(Document):
     def validate(self):
         self.validate_installment_months()
         self.validate_percentages()
+        self.validate_holidays()
     
     def validate_installment_months(self):
         if self.min_installment_months and self.max_installment_months:
@@ -26,3 +29,9 @@ class MerchantSettings(Document):
         
         if self.late_fee_percentage and self.late_fee_percentage > 50:
             frappe.msgprint("Late fee percentage is very high. Please verify.")
+    
+    def validate_holidays(self):
+        try:
+            parse_holidays(self.holidays or "")
+        except Exception:
+            frappe.throw("Holidays must be one date per line in YYYY-MM-DD format")
@@ -7,10 +7,22 @@ import frappe
 from frappe.model.document import Document
 
 
+DEFAULT_TEMPLATE_CACHE_KEY = "nasiya365:default_print_template"
+
+
 class PrintTemplate(Document):
     def validate(self):
         self.validate_default()
     
+    def on_update(self):
+        clear_default_template_cache()
+    
+    def on_trash(self):
+        clear_default_template_cache()
+    
+    def after_rename(self, old, new, merge=False):
+        clear_default_template_cache()
+    
     def validate_default(self):
         """Ensure only one default template per type and language"""
         if self.is_default:
@@ -26,9 +38,29 @@ class PrintTemplate(Document):
             )
 
 
+def clear_default_template_cache():
+    """
+    Drop all cached defaults
+    
+    Saving one template can clear the default flag on others, so the whole
+    cache goes. Cleared again after commit so a request reading between
+    our update and the commit cannot leave the old default cached.
+    """
+    frappe.cache().delete_value(DEFAULT_TEMPLATE_CACHE_KEY)
+    frappe.db.after_commit.add(lambda: frappe.cache().delete_value(DEFAULT_TEMPLATE_CACHE_KEY))
+
+
 @frappe.whitelist()
 def get_default_template(template_type, language="uz"):
-    """Get default template for a type and language"""
+    """Get default template for a type and language, cached until a Print Template changes"""
+    return frappe.cache().hget(
+        DEFAULT_TEMPLATE_CACHE_KEY,
+        f"{template_type}|{language}",
+        generator=lambda: _get_default_template(template_type, language)
+    )
+
+
+def _get_default_template(template_type, language):
     template = frappe.db.get_value(
         "Print Template",
         {"template_type": template_type, "language": language, "is_default": 1},
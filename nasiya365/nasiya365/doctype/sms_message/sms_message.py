@@ -0,0 +1,10 @@
+"""
+SMS Message DocType Controller
+One row per outgoing SMS; doubles as the sent-log for scheduled reminders
+"""
+
+from frappe.model.document import Document
+
+
+class SMSMessage(Document):
+    pass
@@ -0,0 +1,64 @@
+"""
+Fill Customer Phone Number.phone_normalized for existing numbers
+
+Runs after the column and its unique index exist. When the same number is
+stored on several customers (in different shapes), the oldest customer keeps
+it; the other rows are left empty and logged so they can be merged by hand.
+"""
+
+import frappe
+
+from nasiya365.utils.phone import normalize_phone
+
+
+CHUNK_SIZE = 1000
+
+
+def execute():
+    rows = frappe.db.sql("""
+        SELECT cpn.name, cpn.parent, cpn.phone_number
+        FROM `tabCustomer Phone Number` cpn
+        INNER JOIN `tabCustomer Profile` cp ON cp.name = cpn.parent
+        WHERE cpn.parenttype = 'Customer Profile'
+        ORDER BY cp.creation, cpn.idx
+    """, as_dict=True)
+
+    owners = {}
+    duplicates = []
+    updates = []
+
+    for row in rows:
+        normalized = normalize_phone(row.phone_number)
+        if normalized and normalized in owners:
+            duplicates.append(f"{row.phone_number} ({row.parent}, already on {owners[normalized]})")
+            normalized = None
+        elif normalized:
+            owners[normalized] = row.parent
+        updates.append((row.name, normalized))
+
+    frappe.db.sql("UPDATE `tabCustomer Phone Number` SET phone_normalized = NULL")
+
+    for start in range(0, len(updates), CHUNK_SIZE):
+        chunk = [(name, normalized) for name, normalized in updates[start:start + CHUNK_SIZE] if normalized]
+        if not chunk:
+            continue
+
+        values = {}
+        cases = []
+        for i, (name, normalized) in enumerate(chunk):
+            values[f"n{i}"] = name
+            values[f"p{i}"] = normalized
+            cases.append(f"WHEN %(n{i})s THEN %(p{i})s")
+        values["names"] = tuple(name for name, _ in chunk)
+
+        frappe.db.sql(f"""
+            UPDATE `tabCustomer Phone Number`
+            SET phone_normalized = CASE name {' '.join(cases)} END
+            WHERE name IN %(names)s
+        """, values)
+
+    if duplicates:
+        frappe.log_error(
+            "Phone numbers shared by several customers:\n" + "\n".join(duplicates),
+            "Phone normalization duplicates"
+        )
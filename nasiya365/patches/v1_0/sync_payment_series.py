@@ -0,0 +1,27 @@
+"""
+Move the Payment Transaction series counters to the PAY-YYYY- keys
+
+Payment Transaction was named with a format: autoname, whose counter key is
+chosen by Frappe rather than by the visible prefix. The doctype now uses
+PAY-.YYYY.-.#####, so each year's counter is raised to the highest number
+already issued to avoid reusing names.
+"""
+
+import frappe
+from frappe.utils import cint
+
+
+def execute():
+    issued = frappe.db.sql("""
+        SELECT LEFT(name, 9) as prefix, MAX(CAST(SUBSTRING(name, 10) AS UNSIGNED)) as current
+        FROM `tabPayment Transaction`
+        WHERE name REGEXP '^PAY-[0-9]{4}-[0-9]+$'
+        GROUP BY LEFT(name, 9)
+    """, as_dict=True)
+
+    for row in issued:
+        current = frappe.db.sql("SELECT current FROM `tabSeries` WHERE name = %s FOR UPDATE", row.prefix)
+        if not current:
+            frappe.db.sql("INSERT INTO `tabSeries` (name, current) VALUES (%s, %s)", (row.prefix, cint(row.current)))
+        elif cint(current[0][0]) < cint(row.current):
+            frappe.db.sql("UPDATE `tabSeries` SET current = %s WHERE name = %s", (cint(row.current), row.prefix))
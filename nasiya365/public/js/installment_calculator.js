@@ -148,32 +148,81 @@ nasiya365.InstallmentCalculator = class {
         const months = parseInt(values.installment_months) || 12;
         const annual_rate = parseFloat(values.interest_rate) || 0;
 
-        // Calculate down payment
+        // Down payment is shown at once, the schedule comes from the server
         const down_payment = price * (down_percent / 100);
-        const principal = price - down_payment;
-
-        // Calculate monthly payment using amortization formula
-        const monthly_rate = annual_rate / 12 / 100;
-        let monthly_payment = 0;
-        let total_interest = 0;
-
-        if (monthly_rate > 0) {
-            monthly_payment = (principal * monthly_rate) / (1 - Math.pow(1 + monthly_rate, -months));
-            total_interest = (monthly_payment * months) - principal;
-        } else {
-            // No interest
-            monthly_payment = principal / months;
-            total_interest = 0;
+        this.dialog.set_value('down_payment_amount', down_payment.toFixed(2));
+        this.dialog.set_value('financed_amount', (price - down_payment).toFixed(2));
+
+        this.request_preview({
+            principal: price,
+            down_payment: down_payment.toFixed(2),
+            interest_rate: annual_rate / 12,
+            num_installments: months,
+            frequency: 'Ежемесячно',
+            start_date: frappe.datetime.get_today(),
+            interest_method: 'Аннуитетный'
+        });
+    }
+
+    request_preview(args) {
+        const key = JSON.stringify(args);
+        this.latest_key = key;
+        if (this.results && this.results.has(key)) {
+            // Drop inputs an already scheduled fetch would otherwise send
+            this.pending_args = null;
+            this.show_preview(this.results.get(key), args);
+            return;
         }
 
-        const total_payment = down_payment + (monthly_payment * months);
+        // Only the latest inputs matter: wait for typing to pause and never
+        // have more than one request in flight
+        this.pending_args = args;
+        if (!this.debounced_fetch) {
+            this.debounced_fetch = frappe.utils.debounce(() => this.fetch_preview(), 300);
+        }
+        this.debounced_fetch();
+    }
 
-        // Update result fields
-        this.dialog.set_value('down_payment_amount', down_payment.toFixed(2));
-        this.dialog.set_value('financed_amount', principal.toFixed(2));
-        this.dialog.set_value('monthly_payment', monthly_payment.toFixed(2));
-        this.dialog.set_value('total_interest', total_interest.toFixed(2));
-        this.dialog.set_value('total_payment', total_payment.toFixed(2));
+    fetch_preview() {
+        if (this.in_flight || !this.pending_args) return;
+
+        const args = this.pending_args;
+        const key = JSON.stringify(args);
+        this.pending_args = null;
+        this.in_flight = true;
+
+        frappe.call({
+            method: 'nasiya365.nasiya365.doctype.installment_plan.installment_plan.calculate_installment_preview',
+            args: args
+        }).then((r) => {
+            if (r.message) {
+                this.remember(key, r.message);
+                // Drop answers for inputs the user has already changed
+                if (key === this.latest_key) {
+                    this.show_preview(r.message, args);
+                }
+            }
+        }).always(() => {
+            this.in_flight = false;
+            // Inputs changed while waiting: send only the newest ones
+            if (this.pending_args) {
+                this.fetch_preview();
+            }
+        });
+    }
+
+    remember(key, result) {
+        this.results = this.results || new Map();
+        this.results.set(key, result);
+        if (this.results.size > 50) {
+            this.results.delete(this.results.keys().next().value);
+        }
+    }
+
+    show_preview(result, args) {
+        this.dialog.set_value('monthly_payment', flt(result.installment_amount).toFixed(2));
+        this.dialog.set_value('total_interest', flt(result.total_interest).toFixed(2));
+        this.dialog.set_value('total_payment', (flt(args.down_payment) + flt(result.total_amount)).toFixed(2));
     }
 };
 
@@ -4,92 +4,167 @@ Daily Scheduled Tasks for Nasiya365
 
 import frappe
 from frappe import _
-from frappe.utils import today, add_days, getdate
+from frappe.utils import today, add_days, getdate, now
 
+from nasiya365.tasks.fanout import fan_out, get_branch_queue, report_branch_done
+from nasiya365.tasks.reminders import get_reminder_recipients, send_reminders
+from nasiya365.tasks.runner import run_chunked
+from nasiya365.utils.due_index import OPEN_STATUSES, remove_installments
 
-def check_overdue_installments():
+
+def check_overdue_installments(branch=None, run_id=None, checkpoint=None):
     """
     Check for overdue installments and update their status.
-    Runs daily at midnight.
+    Runs daily at midnight, fanned out into one job per branch. The hourly
+    flag_new_overdue job flips most rows from the due-date index; this
+    sweep catches anything missing from the index and applies late fees to
+    overdue rows on the day they pass the grace period.
     """
-    frappe.logger().info("Running: check_overdue_installments")
-    
-    overdue_count = 0
-    
-    # Get all pending installments that are past due
-    overdue_installments = frappe.db.sql("""
-        SELECT 
-            parent as installment_plan,
-            name as schedule_name,
-            due_date,
-            amount
-        FROM `tabInstallment Schedule`
-        WHERE status = 'Pending'
-        AND due_date < %s
-    """, (today(),), as_dict=True)
-    
-    for installment in overdue_installments:
-        # Update schedule status to Overdue
-        frappe.db.set_value(
-            "Installment Schedule",
-            installment.schedule_name,
-            "status",
-            "Overdue"
-        )
-        overdue_count += 1
-        
-        # Check if we need to apply late fee
-        plan = frappe.get_doc("Installment Plan", installment.installment_plan)
-        days_overdue = (getdate(today()) - getdate(installment.due_date)).days
-        
-        # Apply late fee after grace period (get from merchant settings)
-        grace_period = frappe.db.get_single_value("Merchant Settings", "grace_period_days") or 3
-        
-        if days_overdue > grace_period:
-            apply_late_fee(plan, installment)
-    
-    frappe.db.commit()
-    frappe.logger().info(f"Marked {overdue_count} installments as overdue")
-
-
-def apply_late_fee(plan, installment):
-    """Apply late fee to an overdue installment"""
+    if run_id is None:
+        frappe.logger().info("Running: check_overdue_installments")
+        fan_out("check_overdue_installments", "nasiya365.tasks.daily.check_overdue_installments")
+        return
+
+    run_date = today()
+
+    # Apply late fee after grace period (get from merchant settings)
+    grace_period = frappe.db.get_single_value("Merchant Settings", "grace_period_days") or 3
     late_fee_percentage = frappe.db.get_single_value("Merchant Settings", "late_fee_percentage") or 1
+
+    # Rows already flagged overdue get their fee once, on the day they
+    # cross the grace period
+    fee_date = add_days(run_date, -(grace_period + 1))
+
+    def fetch_chunk(after, limit):
+        # Open (unpaid or partly paid) installments that are past due and
+        # overdue ones crossing the grace period today, paged by schedule name
+        return frappe.db.sql("""
+            SELECT
+                isc.parent as installment_plan,
+                isc.name as schedule_name,
+                isc.due_date,
+                isc.amount
+            FROM `tabInstallment Schedule` isc
+            INNER JOIN `tabInstallment Plan` ip ON ip.name = isc.parent
+            LEFT JOIN `tabSales Order` so ON so.name = ip.sales_order
+            WHERE (
+                (isc.status IN %(open_statuses)s AND isc.due_date < %(run_date)s)
+                OR (isc.status = 'Просрочен' AND isc.due_date = %(fee_date)s)
+            )
+            AND ip.docstatus = 1
+            AND IFNULL(so.branch, '') = %(branch)s
+            AND isc.name > %(after)s
+            ORDER BY isc.name
+            LIMIT %(limit)s
+        """, {"run_date": run_date, "open_statuses": OPEN_STATUSES, "fee_date": fee_date, "branch": branch, "after": after or "", "limit": limit}, as_dict=True)
+
+    def process_chunk(installments):
+        # Update schedule status to Overdue for the whole chunk at once;
+        # rows that are already overdue are left alone
+        mark_installments_overdue([i.schedule_name for i in installments])
+
+        for installment in installments:
+            days_overdue = (getdate(run_date) - getdate(installment.due_date)).days
+            if days_overdue > grace_period:
+                apply_late_fee(installment.installment_plan, installment, late_fee_percentage)
+
+        return len(installments)
+
+    result = run_chunked(
+        f"check_overdue_installments:{branch}",
+        "nasiya365.tasks.daily.check_overdue_installments",
+        fetch_chunk,
+        process_chunk,
+        checkpoint=checkpoint,
+        key="schedule_name",
+        job_kwargs={"branch": branch, "run_id": run_id},
+        queue=get_branch_queue()
+    )
+
+    if result.done:
+        frappe.logger().info(f"Marked {result.processed} installments as overdue in branch '{branch}'")
+        report_branch_done("check_overdue_installments", run_id, branch, overdue=result.processed)
+
+
+def mark_installments_overdue(names):
+    """
+    Flip open (unpaid or partly paid) schedule rows to Overdue
+
+    Also bumps each plan's incremental overdue counter (and `modified`, so
+    a payment posted from a copy loaded earlier fails its timestamp check
+    instead of overwriting the counter) and drops the rows from the
+    due-date index. Rows that are no longer open are left alone.
+    """
+    if not names:
+        return
+
+    names = tuple(names)
+
+    # Keep the plans' incremental overdue counters in step
+    frappe.db.sql("""
+        UPDATE `tabInstallment Plan` ip
+        INNER JOIN (
+            SELECT parent, COUNT(*) as cnt
+            FROM `tabInstallment Schedule`
+            WHERE name IN %(names)s
+            AND status IN %(open_statuses)s
+            GROUP BY parent
+        ) flipped ON flipped.parent = ip.name
+        SET
+            ip.overdue_installments = IFNULL(ip.overdue_installments, 0) + flipped.cnt,
+            ip.modified = %(modified)s
+    """, {"names": names, "open_statuses": OPEN_STATUSES, "modified": now()})
+
+    frappe.db.sql("""
+        UPDATE `tabInstallment Schedule`
+        SET status = 'Просрочен'
+        WHERE name IN %(names)s
+        AND status IN %(open_statuses)s
+    """, {"names": names, "open_statuses": OPEN_STATUSES})
+
+    remove_installments(names)
+
+
+def apply_late_fee(plan, installment, late_fee_percentage=None):
+    """Apply late fee to an overdue installment"""
+    if late_fee_percentage is None:
+        late_fee_percentage = frappe.db.get_single_value("Merchant Settings", "late_fee_percentage") or 1
     late_fee = (installment.amount * late_fee_percentage) / 100
-    
+
     # Record late fee (implement based on your late fee tracking approach)
     frappe.logger().info(f"Late fee of {late_fee} applied to {installment.schedule_name}")
 
 
-def send_payment_reminders():
+def send_payment_reminders(branch=None, run_id=None, checkpoint=None):
     """
     Send payment reminders for installments due tomorrow.
-    Runs daily.
+    Runs daily, fanned out into one job per branch.
     """
-    frappe.logger().info("Running: send_payment_reminders")
-    
+    if run_id is None:
+        frappe.logger().info("Running: send_payment_reminders")
+        fan_out("send_payment_reminders", "nasiya365.tasks.daily.send_payment_reminders")
+        return
+
     tomorrow = add_days(today(), 1)
-    
-    # Get installments due tomorrow
-    due_tomorrow = frappe.db.sql("""
-        SELECT 
-            ip.customer,
-            ip.name as installment_plan,
-            isc.due_date,
-            isc.amount,
-            cp.phone,
-            cp.customer_name
-        FROM `tabInstallment Plan` ip
-        INNER JOIN `tabInstallment Schedule` isc ON isc.parent = ip.name
-        INNER JOIN `tabCustomer Profile` cp ON cp.name = ip.customer
-        WHERE isc.status = 'Pending'
-        AND isc.due_date = %s
-    """, (tomorrow,), as_dict=True)
-    
-    for payment in due_tomorrow:
-        # Send SMS reminder (implement based on your SMS provider)
-        message = f"Hurmatli {payment.customer_name}, ertaga {payment.amount:,.0f} so'm to'lov muddati. Nasiya365"
-        # send_sms(payment.phone, message)
-        frappe.logger().info(f"Reminder sent to {payment.customer_name} for {payment.amount}")
-    
-    frappe.logger().info(f"Sent {len(due_tomorrow)} payment reminders")
+
+    def fetch_chunk(after, limit):
+        # Customers with installments due tomorrow, one row per recipient
+        return get_reminder_recipients("Напоминание", tomorrow, branch, after, limit, due_date=tomorrow)
+
+    def process_chunk(recipients):
+        return send_reminders("Напоминание", tomorrow, recipients)
+
+    result = run_chunked(
+        f"send_payment_reminders:{branch}",
+        "nasiya365.tasks.daily.send_payment_reminders",
+        fetch_chunk,
+        process_chunk,
+        checkpoint=checkpoint,
+        key="customer",
+        job_kwargs={"branch": branch, "run_id": run_id},
+        queue=get_branch_queue()
+    )
+
+    if result.done:
+        frappe.logger().info(f"Sent {result.processed} payment reminders in branch '{branch}'")
+        report_branch_done("send_payment_reminders", run_id, branch, reminders=result.processed)
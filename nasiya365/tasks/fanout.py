@@ -0,0 +1,92 @@
+"""
+Branch Fan-out for Nasiya365 Scheduled Tasks
+Splits a scheduled job into one sub-job per Branch so several workers can
+process branches in parallel, and aggregates their counts for the log
+"""
+
+import frappe
+from frappe.utils import now
+
+
+# Queue for per-branch sub-jobs; point it at a dedicated queue by adding it
+# to "workers" in common_site_config.json and setting nasiya365_branch_queue
+DEFAULT_BRANCH_QUEUE = "long"
+
+# Shard for plans whose Sales Order has no branch (or that have no Sales Order)
+NO_BRANCH = ""
+
+RUN_TTL = 24 * 60 * 60
+
+
+def get_branch_queue():
+    return frappe.conf.get("nasiya365_branch_queue") or DEFAULT_BRANCH_QUEUE
+
+
+def fan_out(job_name, method, **kwargs):
+    """
+    Enqueue `method` once per branch
+
+    Each sub-job is called with `branch` and `run_id` and must call
+    `report_branch_done` when it has finished its branch.
+
+    Returns:
+        str: run id shared by all sub-jobs
+    """
+    branches = frappe.get_all("Branch", pluck="name", order_by="name asc")
+    branches.append(NO_BRANCH)
+
+    run_id = frappe.generate_hash(length=10)
+    cache = frappe.cache()
+    run_key = cache.make_key(_run_key(job_name, run_id))
+
+    # Raw hash commands: counters must stay plain integers for HINCRBY
+    cache.hincrby(run_key, "pending", len(branches))
+    cache.hincrby(run_key, "branches", len(branches))
+    cache.expire(run_key, RUN_TTL)
+
+    queue = get_branch_queue()
+    for branch in branches:
+        frappe.enqueue(
+            method,
+            queue=queue,
+            branch=branch,
+            run_id=run_id,
+            enqueue_after_commit=True,
+            **kwargs
+        )
+
+    frappe.logger().info(
+        f"{job_name}: enqueued {len(branches)} branch jobs on '{queue}' (run {run_id}, {now()})"
+    )
+    return run_id
+
+
+def report_branch_done(job_name, run_id, branch, **counts):
+    """
+    Add a finished branch's counts to the run totals
+
+    The last branch to report logs the aggregated counts for the whole run.
+    """
+    if not run_id:
+        return
+
+    cache = frappe.cache()
+    run_key = cache.make_key(_run_key(job_name, run_id))
+
+    for field, value in counts.items():
+        cache.hincrby(run_key, field, int(value or 0))
+
+    pending = cache.hincrby(run_key, "pending", -1)
+    frappe.logger().info(f"{job_name}: branch '{branch or '-'}' done {counts} (run {run_id}, {pending} left)")
+
+    if pending <= 0:
+        totals = {
+            frappe.safe_decode(field): frappe.safe_decode(value)
+            for field, value in cache.execute_command("HGETALL", run_key).items()
+        }
+        cache.delete(run_key)
+        frappe.logger().info(f"{job_name}: run {run_id} finished {totals}")
+
+
+def _run_key(job_name, run_id):
+    return f"nasiya365:fanout:{job_name}:{run_id}"
@@ -4,28 +4,60 @@ Hourly Scheduled Tasks for Nasiya365
 
 import frappe
 
+from nasiya365.tasks.daily import mark_installments_overdue
+from nasiya365.tasks.runner import run_chunked
+from nasiya365.utils.due_index import pop_overdue
 
-def sync_payment_status():
+
+def sync_payment_status(checkpoint=None):
     """
     Sync payment status with payment gateways.
     Checks pending transactions and updates their status.
     """
     frappe.logger().info("Running: sync_payment_status")
-    
-    # Get all pending payment transactions
-    pending_payments = frappe.get_all(
-        "Payment Transaction",
-        filters={"status": "Pending"},
-        fields=["name", "transaction_id", "payment_method", "amount"]
+
+    def fetch_chunk(after, limit):
+        # Get pending payment transactions, paged by name
+        return frappe.get_all(
+            "Payment Transaction",
+            filters={"status": "Ожидает", "name": [">", after or ""]},
+            fields=["name", "transaction_id", "payment_method", "amount"],
+            order_by="name asc",
+            limit_page_length=limit
+        )
+
+    def process_chunk(pending_payments):
+        for payment in pending_payments:
+            # Check status with respective payment gateway
+            if payment.payment_method == "Click":
+                # check_click_status(payment)
+                pass
+            elif payment.payment_method == "Payme":
+                # check_payme_status(payment)
+                pass
+        return len(pending_payments)
+
+    result = run_chunked(
+        "sync_payment_status",
+        "nasiya365.tasks.hourly.sync_payment_status",
+        fetch_chunk,
+        process_chunk,
+        checkpoint=checkpoint
     )
-    
-    for payment in pending_payments:
-        # Check status with respective payment gateway
-        if payment.payment_method == "Click":
-            # check_click_status(payment)
-            pass
-        elif payment.payment_method == "Payme":
-            # check_payme_status(payment)
-            pass
-    
-    frappe.logger().info(f"Checked {len(pending_payments)} pending payments")
+
+    frappe.logger().info(f"Checked {result.processed} pending payments")
+
+
+def flag_new_overdue():
+    """
+    Mark installments that just became overdue.
+    Pops them from the due-date index instead of scanning the schedule table.
+    """
+    flagged = 0
+    for names in pop_overdue():
+        mark_installments_overdue(names)
+        frappe.db.commit()
+        flagged += len(names)
+
+    if flagged:
+        frappe.logger().info(f"Flagged {flagged} installments as overdue from the due-date index")
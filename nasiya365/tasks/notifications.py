@@ -3,67 +3,202 @@ Notification Tasks for Nasiya365
 """
 
 import frappe
-from frappe.utils import today
+from frappe.utils import add_to_date, now_datetime, today
+from redis.exceptions import LockError
 
+from nasiya365.tasks.fanout import fan_out, get_branch_queue, report_branch_done
+from nasiya365.tasks.reminders import get_reminder_recipients, send_reminders
+from nasiya365.tasks.runner import resume_job, run_chunked
+from nasiya365.utils import sms_manager
 
-def send_due_today_reminders():
+
+# Seconds the queue lock is held at most; above the runner's time budget
+SMS_QUEUE_LOCK_TIMEOUT = 600
+
+
+def send_due_today_reminders(branch=None, run_id=None, checkpoint=None):
     """
     Send reminders for payments due today.
-    Runs at 9 AM daily.
+    Runs at 9 AM daily, fanned out into one job per branch.
     """
-    frappe.logger().info("Running: send_due_today_reminders")
-    
-    # Get installments due today
-    due_today = frappe.db.sql("""
-        SELECT 
-            ip.customer,
-            ip.name as installment_plan,
-            isc.due_date,
-            isc.amount,
-            cp.phone,
-            cp.customer_name
-        FROM `tabInstallment Plan` ip
-        INNER JOIN `tabInstallment Schedule` isc ON isc.parent = ip.name
-        INNER JOIN `tabCustomer Profile` cp ON cp.name = ip.customer
-        WHERE isc.status = 'Pending'
-        AND isc.due_date = %s
-    """, (today(),), as_dict=True)
-    
-    for payment in due_today:
-        message = f"Hurmatli {payment.customer_name}, bugun {payment.amount:,.0f} so'm to'lov kuni. Nasiya365"
-        # send_sms(payment.phone, message)
-        frappe.logger().info(f"Due today reminder sent to {payment.customer_name}")
-    
-    frappe.logger().info(f"Sent {len(due_today)} due today reminders")
-
-
-def send_overdue_warnings():
+    if run_id is None:
+        frappe.logger().info("Running: send_due_today_reminders")
+        fan_out("send_due_today_reminders", "nasiya365.tasks.notifications.send_due_today_reminders")
+        return
+
+    run_date = today()
+
+    def fetch_chunk(after, limit):
+        # Customers with installments due today, one row per recipient
+        return get_reminder_recipients("Срок сегодня", run_date, branch, after, limit, due_date=run_date)
+
+    def process_chunk(recipients):
+        return send_reminders("Срок сегодня", run_date, recipients)
+
+    result = run_chunked(
+        f"send_due_today_reminders:{branch}",
+        "nasiya365.tasks.notifications.send_due_today_reminders",
+        fetch_chunk,
+        process_chunk,
+        checkpoint=checkpoint,
+        key="customer",
+        job_kwargs={"branch": branch, "run_id": run_id},
+        queue=get_branch_queue()
+    )
+
+    if result.done:
+        frappe.logger().info(f"Sent {result.processed} due today reminders in branch '{branch}'")
+        report_branch_done("send_due_today_reminders", run_id, branch, reminders=result.processed)
+
+
+def send_overdue_warnings(branch=None, run_id=None, checkpoint=None):
     """
     Send warnings for overdue payments.
-    Runs at 6 PM daily.
+    Runs at 6 PM daily, fanned out into one job per branch.
+    """
+    if run_id is None:
+        frappe.logger().info("Running: send_overdue_warnings")
+        fan_out("send_overdue_warnings", "nasiya365.tasks.notifications.send_overdue_warnings")
+        return
+
+    run_date = today()
+
+    def fetch_chunk(after, limit):
+        # Customers with overdue installments, one row per recipient
+        return get_reminder_recipients("Просрочка", run_date, branch, after, limit, overdue=True)
+
+    def process_chunk(recipients):
+        return send_reminders("Просрочка", run_date, recipients)
+
+    result = run_chunked(
+        f"send_overdue_warnings:{branch}",
+        "nasiya365.tasks.notifications.send_overdue_warnings",
+        fetch_chunk,
+        process_chunk,
+        checkpoint=checkpoint,
+        key="customer",
+        job_kwargs={"branch": branch, "run_id": run_id},
+        queue=get_branch_queue()
+    )
+
+    if result.done:
+        frappe.logger().info(f"Sent {result.processed} overdue warnings in branch '{branch}'")
+        report_branch_done("send_overdue_warnings", run_id, branch, warnings=result.processed)
+
+
+def process_sms_queue(checkpoint=None):
     """
-    frappe.logger().info("Running: send_overdue_warnings")
-    
-    # Get overdue installments
-    overdue = frappe.db.sql("""
-        SELECT 
-            ip.customer,
-            ip.name as installment_plan,
-            isc.due_date,
-            isc.amount,
-            cp.phone,
-            cp.customer_name,
-            DATEDIFF(%s, isc.due_date) as days_overdue
-        FROM `tabInstallment Plan` ip
-        INNER JOIN `tabInstallment Schedule` isc ON isc.parent = ip.name
-        INNER JOIN `tabCustomer Profile` cp ON cp.name = ip.customer
-        WHERE isc.status = 'Overdue'
-        ORDER BY days_overdue DESC
-    """, (today(),), as_dict=True)
-    
-    for payment in overdue:
-        message = f"Hurmatli {payment.customer_name}, {payment.amount:,.0f} so'm to'lov {payment.days_overdue} kun kechiktirildi. Iltimos, to'lang. Nasiya365"
-        # send_sms(payment.phone, message)
-        frappe.logger().info(f"Overdue warning sent to {payment.customer_name} ({payment.days_overdue} days)")
-    
-    frappe.logger().info(f"Sent {len(overdue)} overdue warnings")
+    Deliver queued SMS Messages.
+    Runs every minute and whenever messages are queued; failed sends are
+    retried with exponential backoff up to sms_manager.MAX_ATTEMPTS.
+    """
+    cache = frappe.cache()
+    lock = cache.lock(cache.make_key("nasiya365:sms_queue_lock"), timeout=SMS_QUEUE_LOCK_TIMEOUT, blocking_timeout=0)
+    if not lock.acquire():
+        # Another sender is draining the queue
+        return
+
+    queue = frappe.conf.get("nasiya365_sms_queue") or "short"
+    try:
+        sender = sms_manager.SMSManager()
+
+        def fetch_chunk(after, limit):
+            return frappe.db.sql("""
+                SELECT name, phone, message, attempts
+                FROM `tabSMS Message`
+                WHERE status = 'В очереди'
+                AND (next_attempt_at IS NULL OR next_attempt_at <= %(now)s)
+                AND name > %(after)s
+                ORDER BY name
+                LIMIT %(limit)s
+            """, {"now": now_datetime(), "after": after or "", "limit": limit}, as_dict=True)
+
+        def process_chunk(messages):
+            results = sender.send_batch([(m.name, m.phone, m.message) for m in messages])
+            sent_at = now_datetime()
+            sent = 0
+            updates = {}
+
+            for message in messages:
+                ok, result = results[message.name]
+                attempts = (message.attempts or 0) + 1
+                if ok:
+                    values = {
+                        "status": "Отправлено",
+                        "attempts": attempts,
+                        "sent_at": sent_at,
+                        "provider_message_id": result,
+                        "error": None
+                    }
+                    sent += 1
+                elif attempts >= sms_manager.MAX_ATTEMPTS:
+                    values = {"status": "Ошибка", "attempts": attempts, "error": str(result)}
+                else:
+                    backoff = sms_manager.RETRY_BACKOFF * 2 ** (attempts - 1)
+                    values = {
+                        "attempts": attempts,
+                        "next_attempt_at": add_to_date(sent_at, seconds=backoff),
+                        "error": str(result)
+                    }
+                updates[message.name] = values
+
+            update_queued_messages(updates)
+            return sent
+
+        result = run_chunked(
+            "process_sms_queue",
+            "nasiya365.tasks.notifications.process_sms_queue",
+            fetch_chunk,
+            process_chunk,
+            checkpoint=checkpoint,
+            chunk_size=sms_manager.ESKIZ_BATCH_SIZE * sms_manager.MAX_CONCURRENCY,
+            queue=queue,
+            resume=False
+        )
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # Held past its timeout; another sender may already own it
+            frappe.logger().warning("SMS queue lock expired before the sender finished")
+
+    # Enqueued only once the lock is free, so the continuation can take it
+    if not result.done:
+        resume_job("nasiya365.tasks.notifications.process_sms_queue", result.last_key, queue=queue)
+
+    if result.processed:
+        frappe.logger().info(f"Delivered {result.processed} queued SMS messages")
+
+
+def update_queued_messages(updates):
+    """
+    Write send results for a chunk with one UPDATE
+
+    Only rows still queued are changed: a delivery receipt flushed while
+    the chunk was being sent has already moved its message further and
+    must not be overwritten.
+
+    Args:
+        updates: SMS Message name -> {fieldname: value}
+    """
+    if not updates:
+        return
+
+    values = {"names": tuple(updates)}
+    cases = {}
+    for i, (name, fields) in enumerate(updates.items()):
+        values[f"n{i}"] = name
+        for fieldname, value in fields.items():
+            values[f"{fieldname}_{i}"] = value
+            cases.setdefault(fieldname, []).append(f"WHEN %(n{i})s THEN %({fieldname}_{i})s")
+
+    assignments = [
+        f"`{fieldname}` = CASE name {' '.join(whens)} ELSE `{fieldname}` END"
+        for fieldname, whens in cases.items()
+    ]
+    frappe.db.sql(f"""
+        UPDATE `tabSMS Message`
+        SET {', '.join(assignments)}
+        WHERE name IN %(names)s
+        AND status = 'В очереди'
+    """, values)
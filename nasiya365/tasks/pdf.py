@@ -0,0 +1,182 @@
+"""
+PDF Tasks for Nasiya365
+Bulk contract PDF generation: HTML is rendered in the job, WeasyPrint
+runs in a capped pool of worker processes
+"""
+
+import multiprocessing
+import os
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import frappe
+from frappe import _
+
+from nasiya365.tasks.runner import run_chunked
+from nasiya365.utils.pdf import (
+    attach_contract_pdf,
+    get_cached_pdf,
+    get_content_hash,
+    html_to_pdf,
+    render_contract_htmls
+)
+
+
+# Upper bound on concurrent WeasyPrint processes; each can take a few
+# hundred MB on large documents. Override with nasiya365_pdf_workers.
+MAX_PDF_WORKERS = 4
+
+# Contracts rendered and committed per chunk
+PDF_CHUNK_SIZE = 50
+
+
+@frappe.whitelist(methods=["POST"])
+def enqueue_contract_pdfs(contracts=None, filters=None):
+    """
+    Start a bulk PDF job for the given contracts or Contract filters
+
+    Progress is published to the calling user while the job runs.
+
+    Returns:
+        dict: run_id and the number of contracts queued
+    """
+    frappe.has_permission("Contract", "write", throw=True)
+
+    if isinstance(contracts, str):
+        contracts = frappe.parse_json(contracts)
+    if isinstance(filters, str):
+        filters = frappe.parse_json(filters)
+
+    if contracts:
+        filters = {"name": ("in", contracts)}
+    # get_list applies the caller's read permissions to names and filters alike
+    names = frappe.get_list("Contract", filters=filters or {}, pluck="name", limit_page_length=0)
+
+    run_id = frappe.generate_hash(length=10)
+    if names:
+        frappe.enqueue(
+            "nasiya365.tasks.pdf.generate_contract_pdfs",
+            queue="long",
+            contracts=names,
+            run_id=run_id
+        )
+
+    return {"run_id": run_id, "total": len(names)}
+
+
+def generate_contract_pdfs(contracts, run_id=None, checkpoint=None):
+    """
+    Generate and attach PDFs for a list of contracts
+
+    Runs chunked, so a large batch commits as it goes and continues in a
+    fresh job when the time budget is used up.
+    """
+    names = sorted(set(contracts))
+    total = len(names)
+    progress = frappe._dict(done=bisect_right(names, checkpoint) if checkpoint else 0, failed=0)
+
+    def fetch_chunk(after, limit):
+        start = bisect_right(names, after) if after else 0
+        return [frappe._dict(name=name) for name in names[start:start + limit]]
+
+    with get_pdf_pool() as pool:
+        def process_chunk(rows):
+            return render_contract_pdfs([row.name for row in rows], pool, progress, total)
+
+        result = run_chunked(
+            f"generate_contract_pdfs:{run_id}",
+            "nasiya365.tasks.pdf.generate_contract_pdfs",
+            fetch_chunk,
+            process_chunk,
+            checkpoint=checkpoint,
+            chunk_size=PDF_CHUNK_SIZE,
+            job_kwargs={"contracts": contracts, "run_id": run_id}
+        )
+
+    if result.done:
+        frappe.logger().info(
+            f"Generated {result.processed} contract PDFs ({progress.failed} failed in the last job) for run {run_id}"
+        )
+
+
+def render_contract_pdfs(names, pool, progress=None, total=None):
+    """
+    Render PDFs for the given contracts in the pool and attach them
+
+    Database work (rendering HTML, saving files) stays in this process;
+    the workers only convert HTML to PDF. Contracts whose rendered content
+    already has an attached PDF are not rendered again.
+
+    Returns:
+        int: number of contracts that got a PDF
+    """
+    progress = progress or frappe._dict(done=0, failed=0)
+    total = total or len(names)
+    futures = {}
+    generated = 0
+
+    for name, rendered in render_contract_htmls(names).items():
+        try:
+            if isinstance(rendered, Exception):
+                raise rendered
+            html, css = rendered
+            content_hash = get_content_hash(html, css)
+            file_url = get_cached_pdf(name, content_hash)
+        except Exception:
+            _log_failure(name, progress)
+            continue
+
+        if file_url:
+            _set_pdf_file(name, file_url, progress, total)
+            generated += 1
+        else:
+            futures[pool.submit(html_to_pdf, html, css)] = (name, content_hash)
+
+    for future in as_completed(futures):
+        name, content_hash = futures[future]
+        try:
+            file_url = attach_contract_pdf(name, future.result(), content_hash)
+        except Exception:
+            _log_failure(name, progress)
+            continue
+
+        _set_pdf_file(name, file_url, progress, total)
+        generated += 1
+
+    return generated
+
+
+def get_pdf_pool():
+    """
+    Process pool for WeasyPrint, capped to bound memory
+
+    Workers are spawned rather than forked so they do not inherit the job's
+    database connection, and are recycled regularly to release memory.
+    """
+    workers = min(
+        frappe.conf.get("nasiya365_pdf_workers") or MAX_PDF_WORKERS,
+        os.cpu_count() or 1
+    )
+    kwargs = {"max_workers": workers, "mp_context": multiprocessing.get_context("spawn")}
+    if "max_tasks_per_child" in ProcessPoolExecutor.__init__.__code__.co_varnames:
+        kwargs["max_tasks_per_child"] = 100
+
+    return ProcessPoolExecutor(**kwargs)
+
+
+def _set_pdf_file(name, file_url, progress, total):
+    if frappe.db.get_value("Contract", name, "pdf_file") != file_url:
+        frappe.db.set_value("Contract", name, "pdf_file", file_url)
+
+    progress.done += 1
+    frappe.publish_progress(
+        progress.done * 100 / total,
+        title=_("Генерация PDF договоров"),
+        description=_("{0} из {1}").format(progress.done, total)
+    )
+
+
+def _log_failure(name, progress):
+    progress.failed += 1
+    progress.done += 1
+    frappe.log_error(frappe.get_traceback(), f"Contract PDF failed: {name}")
@@ -0,0 +1,134 @@
+"""
+Shared Reminder Selection for Nasiya365 Notification Tasks
+Groups everything a customer owes into one message per recipient per day
+"""
+
+import frappe
+from frappe.utils import cstr, flt
+
+from nasiya365.utils.notification_templates import get_language, render_message
+from nasiya365.utils.sms_manager import enqueue_dispatch
+
+
+def get_reminder_recipients(message_type, reference_date, branch, after, limit,
+                            due_date=None, overdue=False):
+    """
+    Select reminder recipients, one row per customer and phone
+
+    Installments are summed and their plans listed in SQL. The branch
+    restricts which customers are selected (in WHERE, so each branch job
+    only groups its own customers' installments), not which of their
+    installments are summed. Only submitted plans count. Customers that
+    already have an SMS Message for this message type and date are skipped,
+    which makes re-runs idempotent.
+
+    Args:
+        message_type: SMS Message type used for the sent-log
+        reference_date: Date the reminder run belongs to
+        branch: Only customers with at least one installment in this branch
+        after: Last customer of the previous chunk (keyset paging)
+        due_date: Select installments due on this date
+        overdue: Select overdue installments instead
+
+    Returns:
+        list: customer, phone, customer_name, message_language, amount,
+            installment_plans, installments, due_date, days_overdue
+    """
+    if overdue:
+        status_condition = "{isc}.status = 'Просрочен'"
+    else:
+        status_condition = "{isc}.status IN ('Ожидает', 'Частично') AND {isc}.due_date = %(due_date)s"
+
+    return frappe.db.sql(f"""
+        SELECT
+            ip.customer,
+            cpn.phone_number as phone,
+            CONCAT_WS(' ', cp.first_name, cp.last_name) as customer_name,
+            cp.message_language,
+            SUM(isc.amount - IFNULL(isc.paid_amount, 0)) as amount,
+            GROUP_CONCAT(DISTINCT ip.name ORDER BY ip.name SEPARATOR ', ') as installment_plans,
+            COUNT(*) as installments,
+            MIN(isc.due_date) as due_date,
+            MAX(DATEDIFF(%(reference_date)s, isc.due_date)) as days_overdue
+        FROM `tabInstallment Schedule` isc
+        INNER JOIN `tabInstallment Plan` ip ON ip.name = isc.parent
+        INNER JOIN `tabCustomer Profile` cp ON cp.name = ip.customer
+        INNER JOIN `tabCustomer Phone Number` cpn
+            ON cpn.parent = cp.name AND cpn.is_primary = 1
+        WHERE {status_condition.format(isc="isc")}
+        AND ip.docstatus = 1
+        AND ip.customer > %(after)s
+        AND ip.customer IN (
+            SELECT bip.customer
+            FROM `tabInstallment Schedule` bisc
+            INNER JOIN `tabInstallment Plan` bip ON bip.name = bisc.parent
+            LEFT JOIN `tabSales Order` so ON so.name = bip.sales_order
+            WHERE {status_condition.format(isc="bisc")}
+            AND bip.docstatus = 1
+            AND IFNULL(so.branch, '') = %(branch)s
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM `tabSMS Message` sm
+            WHERE sm.dedupe_key = CONCAT_WS('|', %(message_type)s, %(reference_date)s, ip.customer, cpn.phone_number)
+        )
+        GROUP BY ip.customer, cpn.phone_number
+        ORDER BY ip.customer
+        LIMIT %(limit)s
+    """, {
+        "message_type": message_type,
+        "reference_date": reference_date,
+        "due_date": due_date,
+        "branch": branch,
+        "after": after or "",
+        "limit": limit
+    }, as_dict=True)
+
+
+def send_reminders(message_type, reference_date, recipients):
+    """
+    Queue one SMS per recipient, in the customer's message language
+
+    A recipient can be selected by more than one branch job when their plans
+    span branches; the unique dedupe key lets exactly one of them queue it.
+    The SMS queue sender delivers the messages.
+
+    Returns:
+        int: number of messages queued
+    """
+    if not frappe.db.get_single_value("Merchant Settings", "enable_sms_notifications"):
+        return 0
+
+    queued = 0
+
+    for recipient in recipients:
+        message = render_message(message_type, get_language(recipient.message_language), recipient)
+        log = frappe.get_doc({
+            "doctype": "SMS Message",
+            "customer": recipient.customer,
+            "phone": recipient.phone,
+            "message_type": message_type,
+            "reference_date": reference_date,
+            "amount": flt(recipient.amount),
+            "installment_plans": recipient.installment_plans,
+            "dedupe_key": get_dedupe_key(message_type, reference_date, recipient.customer, recipient.phone),
+            "message": message,
+            "status": "В очереди",
+        })
+
+        try:
+            log.insert(ignore_permissions=True)
+        except frappe.UniqueValidationError:
+            # Already sent by another branch job or an earlier run
+            continue
+
+        queued += 1
+
+    if queued:
+        enqueue_dispatch()
+
+    return queued
+
+
+def get_dedupe_key(message_type, reference_date, customer, phone):
+    """Sent-log key: one message per type, date, customer and phone"""
+    return "|".join([message_type, cstr(reference_date), customer, phone])
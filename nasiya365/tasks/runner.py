@@ -0,0 +1,128 @@
+"""
+Chunked Job Runner for Nasiya365
+Pages through large result sets by keyset, commits between chunks and
+re-enqueues the job when its time budget is used up
+"""
+
+import time
+
+import frappe
+from frappe.utils import now
+
+
+# Rows processed (and committed) per chunk
+DEFAULT_CHUNK_SIZE = 500
+
+# Seconds a job may run before handing over to a fresh job;
+# kept well below the RQ timeout of the "long" queue
+DEFAULT_TIME_BUDGET = 240
+
+CHECKPOINT_TTL = 24 * 60 * 60
+
+
+def run_chunked(job_name, method, fetch_chunk, process_chunk, checkpoint=None,
+                key="name", chunk_size=None, time_budget=None, job_kwargs=None, queue="long",
+                resume=True):
+    """
+    Process a large result set chunk by chunk
+
+    Args:
+        job_name: Name used for the progress checkpoint
+        method: Dotted path of the job, used to re-enqueue it on timeout
+        fetch_chunk: callable(after, limit) returning rows ordered by `key`,
+            all with `key` greater than `after` (None on the first chunk)
+        process_chunk: callable(rows) returning the number of rows handled
+        checkpoint: Last processed key when the job resumes
+        key: Row attribute used for keyset paging
+        job_kwargs: Extra keyword arguments passed to the re-enqueued job
+        queue: Queue the job is re-enqueued on
+        resume: Re-enqueue the job when the time budget is used up; pass
+            False when the caller must clean up first (e.g. release a lock)
+            and then call resume_job itself while `done` is False
+
+    Returns:
+        frappe._dict: processed, chunks, last_key, done
+    """
+    chunk_size = chunk_size or frappe.conf.get("nasiya365_job_chunk_size") or DEFAULT_CHUNK_SIZE
+    time_budget = time_budget or frappe.conf.get("nasiya365_job_time_budget") or DEFAULT_TIME_BUDGET
+
+    state = get_checkpoint(job_name) if checkpoint is not None else None
+    if not state or state.get("last_key") != checkpoint:
+        state = frappe._dict(
+            last_key=checkpoint,
+            processed=0,
+            chunks=0,
+            started_at=now()
+        )
+
+    deadline = time.monotonic() + time_budget
+    done = False
+
+    while True:
+        rows = fetch_chunk(state.last_key, chunk_size)
+        if not rows:
+            done = True
+            break
+
+        state.processed += process_chunk(rows) or 0
+        state.chunks += 1
+        state.last_key = rows[-1][key]
+
+        frappe.db.commit()
+        save_checkpoint(job_name, state, "Running")
+
+        if len(rows) < chunk_size:
+            done = True
+            break
+
+        if time.monotonic() >= deadline:
+            break
+
+    if done:
+        save_checkpoint(job_name, state, "Completed")
+    else:
+        frappe.logger().info(
+            f"{job_name}: time budget reached after {state.processed} rows, resuming from {state.last_key}"
+        )
+        if resume:
+            resume_job(method, state.last_key, job_kwargs, queue)
+
+    return frappe._dict(
+        processed=state.processed,
+        chunks=state.chunks,
+        last_key=state.last_key,
+        done=done
+    )
+
+
+def resume_job(method, checkpoint, job_kwargs=None, queue="long"):
+    """Enqueue the continuation of a chunked job from its checkpoint"""
+    frappe.enqueue(
+        method,
+        queue=queue,
+        checkpoint=checkpoint,
+        enqueue_after_commit=True,
+        **(job_kwargs or {})
+    )
+    frappe.db.commit()
+
+
+def get_checkpoint(job_name):
+    """Return the stored progress of a chunked job, if any"""
+    state = frappe.cache().get_value(_checkpoint_key(job_name))
+    return frappe._dict(state) if state else None
+
+
+def save_checkpoint(job_name, state, status):
+    """Store job progress so a resumed job (or an operator) can pick it up"""
+    state.status = status
+    state.updated_at = now()
+    frappe.cache().set_value(
+        _checkpoint_key(job_name),
+        dict(state),
+        expires_in_sec=CHECKPOINT_TTL
+    )
+
+
+def _checkpoint_key(job_name):
+    return f"nasiya365:job_checkpoint:{job_name}"
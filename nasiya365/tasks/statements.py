@@ -0,0 +1,152 @@
+"""
+Statement Tasks for Nasiya365
+Bulk customer statement PDFs for a period, for the monthly mailing
+"""
+
+from concurrent.futures import as_completed
+
+import frappe
+from frappe import _
+from frappe.utils import add_months, get_first_day, get_last_day, getdate, today
+
+from nasiya365.tasks.pdf import get_pdf_pool
+from nasiya365.tasks.runner import run_chunked
+from nasiya365.utils.pdf import attach_pdf, html_to_pdf
+from nasiya365.utils.statements import (
+    get_cached_statement,
+    get_statement_file_name,
+    get_statements,
+    render_statement_htmls
+)
+
+
+# Customers per chunk: balances are two grouped queries per chunk, so the
+# chunk is bounded by rendering time rather than by the database
+STATEMENT_CHUNK_SIZE = 200
+
+
+def generate_monthly_statements():
+    """Scheduled monthly: statements for the previous calendar month"""
+    last_month = add_months(today(), -1)
+    enqueue_statements(get_first_day(last_month), get_last_day(last_month))
+
+
+@frappe.whitelist(methods=["POST"])
+def enqueue_statements(from_date, to_date, customers=None):
+    """
+    Start a statement job for a period
+
+    Args:
+        customers: list (or JSON) of Customer Profile names; by default
+            every customer with an installment plan
+
+    Returns:
+        dict: run_id
+    """
+    # The job attaches a file to every selected customer
+    frappe.has_permission("Customer Profile", "write", throw=True)
+
+    if isinstance(customers, str):
+        customers = frappe.parse_json(customers)
+    if getdate(from_date) > getdate(to_date):
+        frappe.throw(_("Дата начала периода позже даты окончания"))
+
+    run_id = frappe.generate_hash(length=10)
+    frappe.enqueue(
+        "nasiya365.tasks.statements.generate_statements",
+        queue="long",
+        from_date=str(getdate(from_date)),
+        to_date=str(getdate(to_date)),
+        customers=customers,
+        run_id=run_id
+    )
+
+    return {"run_id": run_id}
+
+
+def generate_statements(from_date, to_date, customers=None, run_id=None, checkpoint=None):
+    """
+    Generate and attach statement PDFs for a period
+
+    Customers are paged by name; each chunk gets its balances from grouped
+    queries, its HTML rendered here and its PDFs converted in the worker
+    pool. Runs chunked, so a full customer base commits as it goes and
+    continues in a fresh job when the time budget is used up.
+    """
+    customer_filter = "AND cp.name IN %(customers)s" if customers else ""
+
+    def fetch_chunk(after, limit):
+        return frappe.db.sql(f"""
+            SELECT cp.name
+            FROM `tabCustomer Profile` cp
+            WHERE cp.name > %(after)s
+            {customer_filter}
+            AND EXISTS (
+                SELECT 1 FROM `tabInstallment Plan` ip
+                WHERE ip.customer = cp.name AND ip.docstatus = 1
+            )
+            ORDER BY cp.name
+            LIMIT %(limit)s
+        """, {"after": after or "", "limit": limit, "customers": tuple(customers or ())}, as_dict=True)
+
+    with get_pdf_pool() as pool:
+        def process_chunk(rows):
+            statements = get_statements([row.name for row in rows], from_date, to_date)
+            return render_statement_pdfs(statements, pool)
+
+        result = run_chunked(
+            f"generate_statements:{run_id}",
+            "nasiya365.tasks.statements.generate_statements",
+            fetch_chunk,
+            process_chunk,
+            checkpoint=checkpoint,
+            chunk_size=STATEMENT_CHUNK_SIZE,
+            job_kwargs={"from_date": from_date, "to_date": to_date, "customers": customers, "run_id": run_id}
+        )
+
+    if result.done:
+        frappe.logger().info(
+            f"Generated {result.processed} statements for {from_date} - {to_date} in run {run_id}"
+        )
+
+
+def render_statement_pdfs(statements, pool):
+    """
+    Render PDFs for a batch of statements in the pool and attach them to
+    the customers
+
+    A statement whose data, customer details and template are unchanged
+    since it was last generated keeps its existing file.
+
+    Returns:
+        int: number of customers that have a statement PDF
+    """
+    futures = {}
+    generated = 0
+
+    for customer, rendered in render_statement_htmls(statements).items():
+        try:
+            if isinstance(rendered, Exception):
+                raise rendered
+            html, css, content_hash = rendered
+            file_name = get_statement_file_name(customer, statements[customer], content_hash)
+            if get_cached_statement(customer, file_name):
+                generated += 1
+                continue
+        except Exception:
+            frappe.log_error(frappe.get_traceback(), f"Statement failed: {customer}")
+            continue
+
+        futures[pool.submit(html_to_pdf, html, css)] = (customer, file_name)
+
+    for future in as_completed(futures):
+        customer, file_name = futures[future]
+        try:
+            attach_pdf("Customer Profile", customer, file_name, future.result())
+        except Exception:
+            frappe.log_error(frappe.get_traceback(), f"Statement failed: {customer}")
+            continue
+
+        generated += 1
+
+    return generated
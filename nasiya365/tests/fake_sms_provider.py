@@ -0,0 +1,113 @@
+"""
+Local fake SMS provider for tests
+Speaks just enough of the Eskiz and Playmobile APIs to exercise SMSManager
+"""
+
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeSMSProvider:
+    """
+    Usage:
+        with FakeSMSProvider() as provider:
+            # point SMSManager at provider.eskiz_url / provider.playmobile_url
+            ...
+            provider.requests  # list of (path, headers, body) received
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.fail_status = None
+        # Answer this many upcoming requests with HTTP 429
+        self.rate_limited = 0
+        self.retry_after = "0.01"
+        self.token = "fake-token"
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def eskiz_url(self):
+        return f"{self.url}/eskiz/api"
+
+    @property
+    def playmobile_url(self):
+        return f"{self.url}/broker-api/send"
+
+    def requests_to(self, path):
+        return [r for r in self.requests if r[0] == path]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length).decode()
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = raw
+                provider.requests.append((self.path, dict(self.headers), body))
+
+                if provider.fail_status:
+                    return self._reply(provider.fail_status, {"message": "fake failure"})
+
+                if provider.rate_limited:
+                    provider.rate_limited -= 1
+                    return self._reply(429, {"message": "Too many requests"}, {"Retry-After": provider.retry_after})
+
+                if self.path == "/eskiz/api/auth/login":
+                    return self._reply(200, {"data": {"token": provider.token}})
+
+                if self.path.startswith("/eskiz/api/message/"):
+                    if self.headers.get("Authorization") != f"Bearer {provider.token}":
+                        return self._reply(401, {"message": "Unauthorized"})
+                    if self.path.endswith("/send-batch"):
+                        return self._reply(200, {
+                            "id": f"batch-{len(provider.requests)}",
+                            "status": ["waiting"] * len(body["messages"])
+                        })
+                    return self._reply(200, {"id": f"sms-{len(provider.requests)}", "status": "waiting"})
+
+                if self.path == "/broker-api/send":
+                    expected = base64.b64encode(b"fake-user:fake-password").decode()
+                    if self.headers.get("Authorization") != f"Basic {expected}":
+                        return self._reply(401, {"message": "Unauthorized"})
+                    # Playmobile answers a successful batch with an empty body
+                    self.send_response(200)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self._reply(404, {"message": "Not found"})
+
+            def _reply(self, status, data, headers=None):
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,38 @@
+import unittest
+from decimal import Decimal
+
+from nasiya365.utils.amortization import ANNUITY, DECLINING, FLAT, amortize, amortize_many
+
+
+class TestAmortization(unittest.TestCase):
+    def test_rows_add_up_exactly(self):
+        for method in (FLAT, ANNUITY, DECLINING):
+            result = amortize(1000000, 0.03, 7, method)
+            rows = result["rows"]
+
+            self.assertEqual(sum(r["principal"] for r in rows), Decimal("1000000.00"), method)
+            self.assertEqual(sum(r["amount"] for r in rows), result["total_amount"], method)
+            self.assertEqual(rows[-1]["balance"], Decimal("0.00"), method)
+
+    def test_flat_residue_goes_to_last_row(self):
+        rows = amortize(1000000, 0.03, 7, FLAT)["rows"]
+
+        self.assertEqual({r["amount"] for r in rows[:-1]}, {Decimal("172857.14")})
+        self.assertEqual(rows[-1]["amount"], Decimal("172857.16"))
+
+    def test_annuity_payment(self):
+        result = amortize(1000000, 0.03, 7, ANNUITY)
+
+        self.assertEqual(result["installment_amount"], Decimal("160506.35"))
+        self.assertEqual(result["total_interest"], Decimal("123544.47"))
+
+    def test_declining_interest_follows_balance(self):
+        rows = amortize(1200000, 0.02, 3, DECLINING)["rows"]
+
+        self.assertEqual([r["interest"] for r in rows], [Decimal("24000.00"), Decimal("16000.00"), Decimal("8000.00")])
+
+    def test_batch_matches_single_plan_totals(self):
+        batch = amortize_many([1000000, 500000], [0.03, 0], [7, 4], ANNUITY)
+
+        self.assertAlmostEqual(float(batch["installment_amount"][0]), 160506.35, places=2)
+        self.assertAlmostEqual(float(batch["total_amount"][1]), 500000.0, places=2)
@@ -0,0 +1,81 @@
+import frappe
+from unittest.mock import patch
+from frappe.tests.utils import FrappeTestCase
+
+from nasiya365 import callbacks
+from nasiya365.callbacks import _parse_receipts, apply_receipts
+
+
+class TestSMSCallbacks(FrappeTestCase):
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def make_message(self, status="Отправлено", provider_message_id=None):
+        return frappe.get_doc({
+            "doctype": "SMS Message",
+            "phone": "+998901234567",
+            "message": "Test",
+            "status": status,
+            "provider_message_id": provider_message_id
+        }).insert(ignore_permissions=True)
+
+    def get_status(self, name):
+        return frappe.db.get_value("SMS Message", name, ["status", "delivery_status", "delivered_at"], as_dict=True)
+
+    def test_parse_eskiz_and_playmobile_payloads(self):
+        eskiz = _parse_receipts({"message_id": 4385062, "user_sms_id": "SMS-1", "status": "DELIVRD",
+                                 "status_date": "2026-10-19 10:00:00"})
+        self.assertEqual(eskiz, [{
+            "name": "SMS-1",
+            "provider_message_id": "4385062",
+            "status": "DELIVRD",
+            "delivered_at": "2026-10-19 10:00:00"
+        }])
+
+        playmobile = _parse_receipts({"messages": [
+            {"message-id": "SMS-2", "status": "UNDELIV"},
+            {"message-id": "SMS-3"},
+        ]})
+        self.assertEqual(len(playmobile), 1)
+        self.assertEqual(playmobile[0]["name"], "SMS-2")
+        self.assertIsNone(playmobile[0]["delivered_at"])
+
+    def test_receipts_are_applied_in_one_update(self):
+        delivered = self.make_message()
+        failed = self.make_message(provider_message_id="P-42")
+
+        applied = apply_receipts(
+            _parse_receipts({"user_sms_id": delivered.name, "status": "DELIVRD", "status_date": "2026-10-19 10:00:00"})
+            + _parse_receipts({"message_id": "P-42", "status": "REJECTD"})
+        )
+
+        self.assertEqual(applied, 2)
+        self.assertEqual(self.get_status(delivered.name).status, "Доставлено")
+        self.assertEqual(str(self.get_status(delivered.name).delivered_at), "2026-10-19 10:00:00")
+        self.assertEqual(self.get_status(failed.name).status, "Не доставлено")
+        self.assertEqual(self.get_status(failed.name).delivery_status, "REJECTD")
+
+    def test_out_of_order_receipts_do_not_downgrade(self):
+        message = self.make_message()
+
+        # Both in one batch, intermediate after final
+        apply_receipts(
+            _parse_receipts({"user_sms_id": message.name, "status": "DELIVRD"})
+            + _parse_receipts({"user_sms_id": message.name, "status": "TRANSMTD"})
+        )
+        self.assertEqual(self.get_status(message.name).status, "Доставлено")
+
+        # A late or retried receipt in a later batch
+        apply_receipts(_parse_receipts({"user_sms_id": message.name, "status": "ACCEPTED"}))
+        status = self.get_status(message.name)
+        self.assertEqual(status.status, "Доставлено")
+        self.assertEqual(status.delivery_status, "DELIVRD")
+
+    def test_webhook_requires_configured_secret(self):
+        frappe.local.form_dict = frappe._dict(token="anything", user_sms_id="SMS-1", status="DELIVRD")
+
+        with patch.dict(frappe.conf, {"nasiya365_sms_callback_secret": None}):
+            self.assertRaises(frappe.PermissionError, callbacks.sms_status)
+
+        with patch.dict(frappe.conf, {"nasiya365_sms_callback_secret": "s3cret"}):
+            self.assertRaises(frappe.PermissionError, callbacks.sms_status)
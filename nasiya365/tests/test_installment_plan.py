@@ -0,0 +1,89 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt
+
+from nasiya365.tasks.daily import mark_installments_overdue
+
+PLAN = "_Test Payment Plan"
+
+
+class TestApplyPayment(FrappeTestCase):
+    def setUp(self):
+        # Raw rows: apply_payment only reads and writes plan and schedule columns
+        frappe.get_doc({
+            "doctype": "Installment Plan",
+            "name": PLAN,
+            "customer": "_Test Customer",
+            "docstatus": 1,
+            "status": "Активный",
+            "total_amount": 300,
+            "paid_amount": 0,
+            "remaining_balance": 300,
+            "paid_installments": 0,
+            "overdue_installments": 1,
+            "modified": "2026-01-01 00:00:00"
+        }).db_insert()
+
+        for i, (due_date, status) in enumerate((
+            ("2026-01-10", "Просрочен"), ("2026-02-10", "Ожидает"), ("2026-03-10", "Ожидает")
+        ), 1):
+            frappe.get_doc({
+                "doctype": "Installment Schedule",
+                "name": f"{PLAN}-{i}",
+                "parent": PLAN,
+                "parenttype": "Installment Plan",
+                "parentfield": "schedule",
+                "idx": i,
+                "installment_number": i,
+                "due_date": due_date,
+                "amount": 100,
+                "paid_amount": 0,
+                "status": status
+            }).db_insert()
+
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def get_rows(self):
+        return frappe.get_all(
+            "Installment Schedule",
+            filters={"parent": PLAN},
+            fields=["paid_amount", "status"],
+            order_by="idx"
+        )
+
+    def test_payment_is_allocated_oldest_first(self):
+        excess = frappe.get_doc("Installment Plan", PLAN).apply_payment(150)
+
+        self.assertEqual(excess, 0)
+        self.assertEqual(
+            [(flt(r.paid_amount), r.status) for r in self.get_rows()],
+            [(100, "Оплачен"), (50, "Частично"), (0, "Ожидает")]
+        )
+
+        plan = frappe.db.get_value("Installment Plan", PLAN, [
+            "paid_amount", "remaining_balance", "paid_installments", "overdue_installments", "status"
+        ], as_dict=True)
+        self.assertEqual(flt(plan.paid_amount), 150)
+        self.assertEqual(flt(plan.remaining_balance), 150)
+        # The overdue row was paid: one paid, no longer overdue
+        self.assertEqual((plan.paid_installments, plan.overdue_installments), (1, 0))
+        self.assertEqual(plan.status, "Активный")
+
+    def test_full_payment_completes_the_plan(self):
+        excess = frappe.get_doc("Installment Plan", PLAN).apply_payment(350)
+
+        self.assertEqual(excess, 50)
+        self.assertTrue(all(r.status == "Оплачен" for r in self.get_rows()))
+
+        plan = frappe.db.get_value("Installment Plan", PLAN, ["paid_installments", "status"], as_dict=True)
+        self.assertEqual(plan.paid_installments, 3)
+        self.assertEqual(plan.status, "Завершен")
+
+    def test_concurrent_overdue_flip_rejects_stale_payment(self):
+        plan = frappe.get_doc("Installment Plan", PLAN)
+
+        mark_installments_overdue([f"{PLAN}-2"])
+
+        self.assertRaises(frappe.TimestampMismatchError, plan.apply_payment, 100)
+        self.assertEqual(frappe.db.get_value("Installment Plan", PLAN, "overdue_installments"), 2)
@@ -0,0 +1,21 @@
+import unittest
+from datetime import date
+
+from nasiya365.utils.jinja_filters import currency_format, date_format, passport_format, phone_format
+
+
+class TestJinjaFilters(unittest.TestCase):
+    def test_currency_uses_space_grouping(self):
+        self.assertEqual(currency_format(1250000), "1 250 000 UZS")
+        self.assertEqual(currency_format(None), "0 UZS")
+
+    def test_date_format(self):
+        self.assertEqual(date_format("2026-02-03"), "03.02.2026")
+        self.assertEqual(date_format("2026-02-03 10:15:00"), "03.02.2026")
+        self.assertEqual(date_format(date(2026, 2, 3), "%Y/%m/%d"), "2026/02/03")
+        self.assertEqual(date_format("not a date"), "not a date")
+
+    def test_phone_and_passport(self):
+        self.assertEqual(phone_format("+998 (90) 123 45 67"), "+998 90 123-45-67")
+        self.assertEqual(phone_format("901234567"), "+998 90 123-45-67")
+        self.assertEqual(passport_format("aa", "1234567"), "AA 1234567")
@@ -0,0 +1,28 @@
+import unittest
+from decimal import Decimal
+
+from nasiya365.utils.notification_templates import get_language, render_message
+
+
+class TestNotificationTemplates(unittest.TestCase):
+    def setUp(self):
+        self.recipient = {
+            "customer_name": "Farruh Yunusov",
+            "amount": Decimal("1250000.00"),
+            "days_overdue": 3
+        }
+
+    def test_renders_in_customer_language(self):
+        self.assertEqual(
+            render_message("Просрочка", get_language("Узбекский"), self.recipient),
+            "Hurmatli Farruh Yunusov, 1,250,000 so'm to'lov 3 kun kechiktirildi. Iltimos, to'lang. Nasiya365"
+        )
+        self.assertIn("просрочена на 3 дн.", render_message("Просрочка", get_language("Русский"), self.recipient))
+        self.assertIn("3 days overdue", render_message("Просрочка", get_language("Английский"), self.recipient))
+
+    def test_unknown_language_falls_back_to_uzbek(self):
+        self.assertEqual(get_language(None), "uz")
+        self.assertEqual(
+            render_message("Напоминание", "de", self.recipient),
+            render_message("Напоминание", "uz", self.recipient)
+        )
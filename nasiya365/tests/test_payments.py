@@ -0,0 +1,148 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt, today
+
+from nasiya365.api.payments import apply_payments, reserve_names
+
+
+class TestReserveNames(FrappeTestCase):
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def insert_payment(self):
+        doc = frappe.get_doc({
+            "doctype": "Payment Transaction",
+            "customer": "_Test Customer",
+            "payment_date": today(),
+            "amount": 1000,
+            "status": "Завершен"
+        })
+        doc.flags.ignore_links = True
+        return doc.insert(ignore_permissions=True)
+
+    def test_reserved_names_share_the_autoname_series(self):
+        first = reserve_names(2)
+        inserted = self.insert_payment().name
+        second = reserve_names(1)
+
+        names = first + [inserted] + second
+        self.assertEqual(len(set(names)), 4)
+
+        prefix = inserted.rsplit("-", 1)[0]
+        self.assertTrue(all(name.rsplit("-", 1)[0] == prefix for name in names))
+
+        numbers = [int(name.rsplit("-", 1)[1]) for name in names]
+        self.assertEqual(numbers, list(range(numbers[0], numbers[0] + 4)))
+
+
+def make_plan(name, docstatus=1, amounts=(100, 100, 100)):
+    """Raw submitted plan with one Ожидает schedule row per amount"""
+    frappe.get_doc({
+        "doctype": "Installment Plan",
+        "name": name,
+        "customer": "_Test Customer",
+        "docstatus": docstatus,
+        "status": "Активный",
+        "total_amount": sum(amounts),
+        "paid_amount": 0,
+        "remaining_balance": sum(amounts),
+        "paid_installments": 0,
+        "overdue_installments": 0
+    }).db_insert()
+
+    for i, amount in enumerate(amounts, 1):
+        frappe.get_doc({
+            "doctype": "Installment Schedule",
+            "name": f"{name}-{i}",
+            "parent": name,
+            "parenttype": "Installment Plan",
+            "parentfield": "schedule",
+            "idx": i,
+            "installment_number": i,
+            "due_date": f"2026-{i:02d}-10",
+            "amount": amount,
+            "paid_amount": 0,
+            "status": "Ожидает"
+        }).db_insert()
+
+
+class TestApplyPayments(FrappeTestCase):
+    def setUp(self):
+        make_plan("_Test Bulk Plan")
+
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def get_rows(self, plan="_Test Bulk Plan"):
+        return [
+            (flt(r.paid_amount), r.status)
+            for r in frappe.get_all(
+                "Installment Schedule",
+                filters={"parent": plan},
+                fields=["paid_amount", "status"],
+                order_by="idx"
+            )
+        ]
+
+    def test_payments_are_allocated_across_rows_in_order(self):
+        results = apply_payments([
+            {"installment_plan": "_Test Bulk Plan", "amount": 150},
+            {"installment_plan": "_Test Bulk Plan", "amount": 100},
+        ])
+
+        self.assertEqual([r["status"] for r in results], ["applied", "applied"])
+        self.assertEqual([r["allocated"] for r in results], [150, 100])
+        self.assertEqual(self.get_rows(), [(100, "Оплачен"), (100, "Оплачен"), (50, "Частично")])
+
+        plan = frappe.db.get_value(
+            "Installment Plan", "_Test Bulk Plan",
+            ["paid_amount", "remaining_balance", "paid_installments", "status"], as_dict=True
+        )
+        self.assertEqual((flt(plan.paid_amount), flt(plan.remaining_balance)), (250, 50))
+        self.assertEqual(plan.paid_installments, 2)
+        self.assertEqual(plan.status, "Активный")
+
+        for result in results:
+            self.assertEqual(
+                frappe.db.get_value("Payment Transaction", result["payment_transaction"], "reference_name"),
+                "_Test Bulk Plan"
+            )
+
+    def test_recorded_transaction_id_is_skipped(self):
+        payment = {"installment_plan": "_Test Bulk Plan", "amount": 100, "transaction_id": "_test-txn-1"}
+
+        first = apply_payments([payment, dict(payment)])
+        again = apply_payments([dict(payment)])
+
+        self.assertEqual([r["status"] for r in first], ["applied", "skipped"])
+        self.assertEqual(again[0]["status"], "skipped")
+        self.assertEqual(frappe.db.count("Payment Transaction", {"transaction_id": "_test-txn-1"}), 1)
+        self.assertEqual(self.get_rows()[0], (100, "Оплачен"))
+        self.assertEqual(self.get_rows()[1], (0, "Ожидает"))
+
+    def test_invalid_payments_are_reported_per_row(self):
+        make_plan("_Test Draft Plan", docstatus=0)
+
+        results = apply_payments([
+            {"installment_plan": "_Test Missing Plan", "amount": 100},
+            {"installment_plan": "_Test Draft Plan", "amount": 100},
+            {"installment_plan": "_Test Bulk Plan", "amount": 0},
+            {"installment_plan": "_Test Bulk Plan", "amount": 100, "payment_method": "Бартер"},
+            {"installment_plan": "_Test Bulk Plan", "amount": 100, "payment_date": "not a date"},
+            {"installment_plan": "_Test Bulk Plan", "amount": 100},
+        ])
+
+        self.assertEqual([r["status"] for r in results], ["error"] * 5 + ["applied"])
+        self.assertEqual(self.get_rows("_Test Draft Plan"), [(0, "Ожидает")] * 3)
+        self.assertEqual(self.get_rows()[0], (100, "Оплачен"))
+
+    def test_full_payment_completes_the_plan(self):
+        results = apply_payments([{"installment_plan": "_Test Bulk Plan", "amount": 350}])
+
+        self.assertEqual((results[0]["allocated"], results[0]["excess"]), (300, 50))
+        self.assertEqual(self.get_rows(), [(100, "Оплачен")] * 3)
+        self.assertEqual(frappe.db.get_value("Installment Plan", "_Test Bulk Plan", "status"), "Завершен")
+
+        # A completed plan takes no further payments
+        results = apply_payments([{"installment_plan": "_Test Bulk Plan", "amount": 100}])
+        self.assertEqual(results[0]["status"], "error")
@@ -0,0 +1,32 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from nasiya365.utils.pdf import get_compiled_template, render_template
+
+
+class TestCompiledTemplates(FrappeTestCase):
+    def make_template(self, body, modified="2026-01-01 00:00:00"):
+        return frappe._dict({
+            "name": "_Test Compiled Template",
+            "modified": modified,
+            "body_html": body,
+            "css_styles": ".total { font-weight: bold; }",
+            "page_size": "A4",
+            "orientation": "Portrait"
+        })
+
+    def test_compiled_once_per_modified(self):
+        template = self.make_template("{{ amount | currency_format }}")
+
+        self.assertIs(get_compiled_template(template), get_compiled_template(template))
+
+        edited = self.make_template("{{ amount }}", modified="2026-01-02 00:00:00")
+        self.assertIsNot(get_compiled_template(edited), get_compiled_template(template))
+
+    def test_app_filters_are_available(self):
+        template = self.make_template("{{ amount | currency_format }} {{ phone | phone_format }}")
+
+        html = render_template(template, {"contract": {"name": "CNT-1"}, "amount": 1500000, "phone": "998901234567"})
+
+        self.assertIn("1\u00a0500\u00a0000 UZS +998 90 123-45-67", html)
+        self.assertIn(".total { font-weight: bold; }", get_compiled_template(template).css)
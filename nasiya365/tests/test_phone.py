@@ -0,0 +1,17 @@
+import unittest
+
+from nasiya365.utils.phone import normalize_phone
+
+
+class TestNormalizePhone(unittest.TestCase):
+    def test_uzbek_shapes_share_one_form(self):
+        for value in ("901234567", "90 123-45-67", "998901234567", "+998 (90) 123 45 67"):
+            self.assertEqual(normalize_phone(value), "+998901234567")
+
+    def test_foreign_numbers_need_plus(self):
+        self.assertEqual(normalize_phone("+7 912 345 67 89"), "+79123456789")
+        self.assertIsNone(normalize_phone("79123456789"))
+
+    def test_unusable_numbers(self):
+        for value in (None, "", "000000000", "+998000000000", "12345", "n/a"):
+            self.assertIsNone(normalize_phone(value))
@@ -0,0 +1,25 @@
+import unittest
+from datetime import date
+
+from nasiya365.utils.schedule_dates import get_due_dates
+
+WORKING_WEEK = (frozenset(), frozenset())
+
+
+class TestScheduleDates(unittest.TestCase):
+    def test_month_end_is_anchored_to_start(self):
+        self.assertEqual(
+            get_due_dates("2026-01-31", "Ежемесячно", 4, WORKING_WEEK),
+            [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 31), date(2026, 4, 30)]
+        )
+
+    def test_weekly_and_biweekly(self):
+        self.assertEqual(get_due_dates("2026-12-28", "Еженедельно", 2, WORKING_WEEK)[-1], date(2027, 1, 4))
+        self.assertEqual(get_due_dates("2026-12-28", "Раз в две недели", 2, WORKING_WEEK)[-1], date(2027, 1, 11))
+
+    def test_non_working_days_shift_forward(self):
+        holidays = frozenset({date(2026, 3, 21)})  # Saturday
+        dates = get_due_dates("2026-01-21", "Ежемесячно", 3, (holidays, frozenset({6})))
+
+        # 21 March is a holiday and 22 March a Sunday
+        self.assertEqual(dates[-1], date(2026, 3, 23))
@@ -0,0 +1,123 @@
+import frappe
+from unittest.mock import patch
+from frappe.tests.utils import FrappeTestCase
+
+from nasiya365.tests.fake_sms_provider import FakeSMSProvider
+from nasiya365.utils import sms_manager
+from nasiya365.utils.sms_manager import SMSManager
+
+
+class TestSMSManagerBatch(FrappeTestCase):
+    def setUp(self):
+        self.provider = FakeSMSProvider().__enter__()
+        self.clear_token()
+
+    def tearDown(self):
+        self.provider.__exit__(None, None, None)
+        self.clear_token()
+        frappe.db.rollback()
+
+    def clear_token(self):
+        cache = frappe.cache()
+        cache.delete(cache.make_key("nasiya365:sms_token:Eskiz"))
+
+    def get_manager(self, provider):
+        settings = frappe.get_single("SMS Gateway Settings")
+        settings.update({
+            "sms_provider": provider,
+            "sender_id": "4546",
+            "eskiz_email": "test@example.com",
+            "eskiz_api_key": "secret",
+            "playmobile_username": "fake-user",
+            "playmobile_password": "fake-password"
+        })
+        settings.save(ignore_permissions=True)
+
+        manager = SMSManager()
+        manager.eskiz_url = self.provider.eskiz_url
+        manager.playmobile_url = self.provider.playmobile_url
+        return manager
+
+    def make_messages(self, count):
+        return [(f"MSG-{i:04d}", f"+99890{i:07d}", f"Test {i}") for i in range(count)]
+
+    def test_eskiz_batch_is_chunked_by_provider_limit(self):
+        manager = self.get_manager("Eskiz")
+        messages = self.make_messages(5)
+
+        with patch.object(sms_manager, "ESKIZ_BATCH_SIZE", 2):
+            results = manager.send_batch(messages)
+
+        batches = self.provider.requests_to("/eskiz/api/message/sms/send-batch")
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(len(self.provider.requests_to("/eskiz/api/auth/login")), 1)
+
+        # Chunks are sent concurrently, so compare them in message order
+        sent = sorted([m["user_sms_id"] for m in b[2]["messages"]] for b in batches)
+        self.assertEqual(sent, [["MSG-0000", "MSG-0001"], ["MSG-0002", "MSG-0003"], ["MSG-0004"]])
+        recipients = sorted(m["to"] for b in batches for m in b[2]["messages"])
+        self.assertEqual(recipients, [f"99890{i:07d}" for i in range(5)])
+
+        self.assertEqual(set(results), {m[0] for m in messages})
+        self.assertTrue(all(ok for ok, reference in results.values()))
+
+    def test_playmobile_batch_maps_message_ids(self):
+        manager = self.get_manager("Playmobile")
+        messages = self.make_messages(3)
+
+        results = manager.send_batch(messages)
+
+        batches = self.provider.requests_to("/broker-api/send")
+        self.assertEqual(len(batches), 1)
+        body = batches[0][2]
+        self.assertEqual([m["message-id"] for m in body["messages"]], [m[0] for m in messages])
+        self.assertEqual(body["messages"][0]["recipient"], "998900000000")
+        self.assertEqual(results["MSG-0001"], (True, "MSG-0001"))
+
+    def test_failed_chunk_marks_its_messages_failed(self):
+        manager = self.get_manager("Playmobile")
+        self.provider.fail_status = 500
+
+        results = manager.send_batch(self.make_messages(2))
+
+        self.assertEqual(len(results), 2)
+        for ok, error in results.values():
+            self.assertFalse(ok)
+            self.assertIn("HTTP 500", error)
+
+    def test_token_is_shared_between_managers(self):
+        self.get_manager("Eskiz").send_batch(self.make_messages(1))
+        self.get_manager("Eskiz").send_batch(self.make_messages(1))
+
+        self.assertEqual(len(self.provider.requests_to("/eskiz/api/auth/login")), 1)
+
+    def test_rejected_token_is_refreshed_once(self):
+        manager = self.get_manager("Eskiz")
+        manager.send_batch(self.make_messages(1))
+        self.provider.token = "rotated-token"
+
+        results = manager.send_batch(self.make_messages(2))
+
+        self.assertTrue(all(ok for ok, reference in results.values()))
+        self.assertEqual(len(self.provider.requests_to("/eskiz/api/auth/login")), 2)
+
+    def test_rate_limited_request_is_retried(self):
+        manager = self.get_manager("Playmobile")
+        self.provider.rate_limited = 1
+
+        results = manager.send_batch(self.make_messages(2))
+
+        self.assertTrue(all(ok for ok, reference in results.values()))
+        self.assertEqual(len(self.provider.requests_to("/broker-api/send")), 2)
+
+    def test_long_retry_after_fails_the_chunk(self):
+        manager = self.get_manager("Playmobile")
+        self.provider.rate_limited = 1
+        self.provider.retry_after = "3600"
+
+        results = manager.send_batch(self.make_messages(2))
+
+        self.assertEqual(len(self.provider.requests_to("/broker-api/send")), 1)
+        for ok, error in results.values():
+            self.assertFalse(ok)
+            self.assertIn("HTTP 429", error)
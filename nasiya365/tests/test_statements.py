@@ -0,0 +1,84 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from nasiya365.utils.statements import get_statements
+
+CUSTOMER = "_Test Statement Customer"
+EMPTY_CUSTOMER = "_Test Statement Empty"
+
+
+class TestStatements(FrappeTestCase):
+    def setUp(self):
+        # Raw rows: the balance engine only reads the tables
+        self.insert_plan("_Test Statement Plan", docstatus=1, rows=[
+            ("2026-01-10", 100), ("2026-02-10", 100), ("2026-03-10", 100)
+        ])
+        # Draft plans never count
+        self.insert_plan("_Test Statement Draft", docstatus=0, rows=[("2026-02-05", 500)])
+
+        self.insert_payment("_Test Statement PT-1", "2026-01-12", 100)
+        self.insert_payment("_Test Statement PT-2", "2026-02-15", 80, late_fee=5)
+
+    def tearDown(self):
+        frappe.db.rollback()
+
+    def insert_plan(self, name, docstatus, rows):
+        frappe.get_doc({
+            "doctype": "Installment Plan",
+            "name": name,
+            "customer": CUSTOMER,
+            "docstatus": docstatus
+        }).db_insert()
+
+        for i, (due_date, amount) in enumerate(rows, 1):
+            frappe.get_doc({
+                "doctype": "Installment Schedule",
+                "name": f"{name}-{i}",
+                "parent": name,
+                "parenttype": "Installment Plan",
+                "parentfield": "schedule",
+                "idx": i,
+                "installment_number": i,
+                "due_date": due_date,
+                "amount": amount,
+                "status": "Ожидает"
+            }).db_insert()
+
+    def insert_payment(self, name, payment_date, amount, late_fee=0):
+        frappe.get_doc({
+            "doctype": "Payment Transaction",
+            "name": name,
+            "customer": CUSTOMER,
+            "payment_date": payment_date,
+            "amount": amount,
+            "late_fee_applied": late_fee,
+            "status": "Завершен",
+            "reference_doctype": "Installment Plan",
+            "reference_name": "_Test Statement Plan"
+        }).db_insert()
+
+    def test_balances_and_lines(self):
+        statements = get_statements([CUSTOMER, EMPTY_CUSTOMER], "2026-02-01", "2026-02-28")
+
+        statement = statements[CUSTOMER]
+        self.assertEqual(statement.opening_balance, 0)
+        self.assertEqual(statement.charges, 100)
+        self.assertEqual(statement.fees, 5)
+        self.assertEqual(statement.payments, 80)
+        self.assertEqual(statement.closing_balance, 25)
+
+        self.assertEqual(
+            [(str(line.date), line.charge, line.payment) for line in statement.lines],
+            [("2026-02-10", 100, 0), ("2026-02-15", 5, 0), ("2026-02-15", 0, 80)]
+        )
+
+        empty = statements[EMPTY_CUSTOMER]
+        self.assertEqual((empty.opening_balance, empty.closing_balance), (0, 0))
+        self.assertEqual(empty.lines, [])
+
+    def test_opening_balance_carries_unpaid_installments(self):
+        statement = get_statements([CUSTOMER], "2026-03-01", "2026-03-31")[CUSTOMER]
+
+        self.assertEqual(statement.opening_balance, 25)
+        self.assertEqual(statement.closing_balance, 125)
+        self.assertEqual([line.charge for line in statement.lines], [100])
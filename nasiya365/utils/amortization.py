@@ -0,0 +1,218 @@
+"""
+Amortization Engine for Nasiya365
+Flat, annuity and declining-balance schedules with exact Decimal rounding,
+plus a vectorized path for pricing many plans at once
+"""
+
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+FLAT = "flat"
+ANNUITY = "annuity"
+DECLINING = "declining"
+
+# Installment Plan interest_method -> engine method
+INTEREST_METHODS = {
+    "Фиксированный": FLAT,
+    "Аннуитетный": ANNUITY,
+    "Дифференцированный": DECLINING,
+}
+
+
+def get_method(interest_method):
+    """Engine method for an Installment Plan interest_method value (flat when unset)"""
+    return INTEREST_METHODS.get(interest_method or "", FLAT)
+
+
+def amortize(financed, rate, periods, method=FLAT, precision=2):
+    """
+    Build an amortization schedule
+
+    Every row is rounded to `precision` decimals and the last row absorbs
+    the rounding residue, so the rows add up exactly to the totals.
+
+    Args:
+        financed: Amount financed
+        rate: Interest rate per installment period as a fraction (0.03 = 3%)
+        periods: Number of installments
+        method: FLAT (simple interest on the financed amount), ANNUITY
+            (equal payments) or DECLINING (equal principal, interest on the
+            outstanding balance)
+
+    Returns:
+        dict: financed_amount, total_interest, total_amount,
+            installment_amount (first row) and rows, each with
+            principal, interest, amount and balance
+    """
+    quantum = Decimal(1).scaleb(-precision)
+    q = lambda value: value.quantize(quantum, rounding=ROUND_HALF_UP)
+
+    financed = q(_decimal(financed))
+    rate = _decimal(rate)
+    periods = int(periods)
+
+    if periods <= 0:
+        return {
+            "financed_amount": financed,
+            "total_interest": Decimal(0),
+            "total_amount": financed,
+            "installment_amount": financed,
+            "rows": []
+        }
+
+    rows = []
+    balance = financed
+
+    if method == FLAT:
+        total_interest = q(financed * rate * periods)
+        principal = q(financed / periods)
+        amount = q((financed + total_interest) / periods)
+        interest_left = total_interest
+        for i in range(periods):
+            if i == periods - 1:
+                principal, interest = balance, interest_left
+            else:
+                interest = amount - principal
+            balance -= principal
+            interest_left -= interest
+            rows.append(_row(principal, interest, balance))
+
+    elif method == ANNUITY:
+        if rate:
+            payment = q(financed * rate / (1 - (1 + rate) ** -periods))
+        else:
+            payment = q(financed / periods)
+        for i in range(periods):
+            interest = q(balance * rate)
+            principal = balance if i == periods - 1 else payment - interest
+            balance -= principal
+            rows.append(_row(principal, interest, balance))
+
+    elif method == DECLINING:
+        step = q(financed / periods)
+        for i in range(periods):
+            interest = q(balance * rate)
+            principal = balance if i == periods - 1 else step
+            balance -= principal
+            rows.append(_row(principal, interest, balance))
+
+    else:
+        raise ValueError(f"Unknown amortization method: {method}")
+
+    total_interest = sum(row["interest"] for row in rows)
+    return {
+        "financed_amount": financed,
+        "total_interest": total_interest,
+        "total_amount": financed + total_interest,
+        "installment_amount": rows[0]["amount"],
+        "rows": rows
+    }
+
+
+def amortize_many(financed, rates, periods, method=FLAT, precision=2):
+    """
+    Price many plans at once from closed-form totals
+
+    Meant for portfolio repricing and what-if analysis: it returns the
+    per-plan totals rounded to `precision`, not the row-level schedule (use
+    amortize for a plan's actual schedule). Uses NumPy when installed and
+    falls back to a per-plan loop otherwise.
+
+    Args:
+        financed, rates, periods: Sequences of equal length (rates per period
+            as fractions)
+
+    Returns:
+        dict: installment_amount, total_interest, total_amount as arrays
+            (lists without NumPy)
+    """
+    if np is None:
+        results = [amortize(p, r, n, method, precision) for p, r, n in zip(financed, rates, periods)]
+        return {
+            key: [float(result[key]) for result in results]
+            for key in ("installment_amount", "total_interest", "total_amount")
+        }
+
+    financed = np.round(np.asarray(financed, dtype=float), precision)
+    rates = np.asarray(rates, dtype=float)
+    periods = np.asarray(periods, dtype=float)
+    safe_periods = np.where(periods > 0, periods, 1)
+
+    if method == FLAT:
+        total_interest = financed * rates * periods
+        installment = (financed + total_interest) / safe_periods
+    elif method == ANNUITY:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            payment = financed * rates / (1 - (1 + rates) ** -safe_periods)
+        installment = np.where(rates != 0, payment, financed / safe_periods)
+        total_interest = installment * periods - financed
+    elif method == DECLINING:
+        total_interest = financed * rates * (periods + 1) / 2
+        installment = financed / safe_periods + financed * rates
+    else:
+        raise ValueError(f"Unknown amortization method: {method}")
+
+    installment = np.where(periods > 0, installment, financed)
+    total_interest = np.where(periods > 0, total_interest, 0)
+
+    return {
+        "installment_amount": np.round(installment, precision),
+        "total_interest": np.round(total_interest, precision),
+        "total_amount": np.round(financed + total_interest, precision)
+    }
+
+
+def benchmark(plans=10000, method=FLAT):
+    """
+    Compare pricing a portfolio plan by plan with the batched path
+
+    Usage: bench --site <site> execute nasiya365.utils.amortization.benchmark --kwargs "{'plans': 10000}"
+    """
+    import random
+
+    rng = random.Random(365)
+    financed = [rng.randrange(500000, 50000000, 1000) for _ in range(plans)]
+    rates = [rng.choice((0, 0.01, 0.02, 0.03, 0.04)) for _ in range(plans)]
+    periods = [rng.choice((3, 6, 9, 12, 18, 24)) for _ in range(plans)]
+
+    def float_loop():
+        # The previous controller arithmetic, one plan at a time
+        for p, r, n in zip(financed, rates, periods):
+            total = p + p * r * n
+            [total / n for _ in range(n)]
+
+    timings = {}
+    for name, run in (
+        ("float loop", float_loop),
+        ("amortize loop", lambda: [amortize(p, r, n, method) for p, r, n in zip(financed, rates, periods)]),
+        ("amortize_many" + ("" if np is not None else " (no numpy)"), lambda: amortize_many(financed, rates, periods, method)),
+    ):
+        start = time.perf_counter()
+        run()
+        timings[name] = round(time.perf_counter() - start, 4)
+
+    for name, seconds in timings.items():
+        print(f"{name:<28} {seconds:>8.4f}s  ({plans} plans, {method})")
+
+    return timings
+
+
+def _row(principal, interest, balance):
+    return {
+        "principal": principal,
+        "interest": interest,
+        "amount": principal + interest,
+        "balance": balance
+    }
+
+
+def _decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value or 0))
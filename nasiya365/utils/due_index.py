@@ -0,0 +1,119 @@
+"""
+Due-date Index for Nasiya365
+A Redis sorted set of open installments scored by due date, so newly
+overdue installments can be popped in O(k) without scanning the schedule table
+"""
+
+import frappe
+from frappe.utils import add_days, getdate, today
+
+
+INDEX_KEY = "nasiya365:due_index"
+
+# Schedule statuses that can still become overdue: unpaid and partly paid
+OPEN_STATUSES = ("Ожидает", "Частично")
+
+# Pops at most this many members per round trip
+POP_BATCH_SIZE = 1000
+
+# Atomically take and remove members due on or before ARGV[1]
+_POP_DUE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #items > 0 then
+    redis.call('ZREM', KEYS[1], unpack(items))
+end
+return items
+"""
+
+
+def index_schedule(plan):
+    """
+    Sync the index with a plan's schedule rows
+
+    Open rows of a submitted plan are added (or re-scored if their due date
+    moved), every other row is removed.
+    """
+    to_add = {}
+    to_remove = []
+
+    for row in plan.get("schedule") or []:
+        if not row.name:
+            continue
+        if row.status in OPEN_STATUSES and plan.docstatus == 1:
+            to_add[row.name] = _score(row.due_date)
+        else:
+            to_remove.append(row.name)
+
+    cache = frappe.cache()
+    key = _index_key()
+    if to_add:
+        cache.zadd(key, to_add)
+    if to_remove:
+        cache.zrem(key, *to_remove)
+
+
+def remove_installments(names):
+    """Drop paid or deleted installments from the index"""
+    if names:
+        frappe.cache().zrem(_index_key(), *names)
+
+
+def pop_overdue(as_of=None):
+    """
+    Remove and yield batches of installment names that are overdue as of a date
+
+    Installments are overdue from the day after their due date.
+    """
+    max_score = _score(add_days(as_of or today(), -1))
+    cache = frappe.cache()
+    key = _index_key()
+
+    while True:
+        names = cache.eval(_POP_DUE_SCRIPT, 1, key, max_score, POP_BATCH_SIZE)
+        if not names:
+            break
+        yield [frappe.safe_decode(name) for name in names]
+        if len(names) < POP_BATCH_SIZE:
+            break
+
+
+def rebuild_index():
+    """
+    Rebuild the index from the schedule table
+
+    Run once after deploying, or whenever Redis was flushed:
+        bench --site <site> execute nasiya365.utils.due_index.rebuild_index
+    """
+    cache = frappe.cache()
+    key = _index_key()
+    cache.delete(key)
+
+    after = ""
+    total = 0
+    while True:
+        rows = frappe.db.sql("""
+            SELECT isc.name, isc.due_date
+            FROM `tabInstallment Schedule` isc
+            INNER JOIN `tabInstallment Plan` ip ON ip.name = isc.parent
+            WHERE isc.status IN %(statuses)s
+            AND ip.docstatus = 1
+            AND isc.name > %(after)s
+            ORDER BY isc.name
+            LIMIT 5000
+        """, {"statuses": OPEN_STATUSES, "after": after}, as_dict=True)
+        if not rows:
+            break
+
+        cache.zadd(key, {row.name: _score(row.due_date) for row in rows})
+        total += len(rows)
+        after = rows[-1].name
+
+    return total
+
+
+def _score(due_date):
+    return getdate(due_date).toordinal()
+
+
+def _index_key():
+    return frappe.cache().make_key(INDEX_KEY)
@@ -0,0 +1,91 @@
+"""
+Notification Templates for Nasiya365
+Localized SMS texts, compiled once per message type and language and
+rendered per recipient from the compiled form
+"""
+
+from functools import lru_cache
+from string import Formatter
+
+
+DEFAULT_LANGUAGE = "uz"
+
+# Customer Profile message_language -> template language
+LANGUAGE_CODES = {
+    "Узбекский": "uz",
+    "Русский": "ru",
+    "Английский": "en",
+    "Uzbek": "uz",
+    "Russian": "ru",
+    "English": "en",
+}
+
+# Placeholders: customer_name, amount, days_overdue, due_date, installment_plans
+TEMPLATES = {
+    "Напоминание": {
+        "uz": "Hurmatli {customer_name}, ertaga {amount:,.0f} so'm to'lov muddati. Nasiya365",
+        "ru": "Уважаемый(ая) {customer_name}, завтра срок оплаты {amount:,.0f} сум. Nasiya365",
+        "en": "Dear {customer_name}, a payment of {amount:,.0f} UZS is due tomorrow. Nasiya365",
+    },
+    "Срок сегодня": {
+        "uz": "Hurmatli {customer_name}, bugun {amount:,.0f} so'm to'lov kuni. Nasiya365",
+        "ru": "Уважаемый(ая) {customer_name}, сегодня день оплаты {amount:,.0f} сум. Nasiya365",
+        "en": "Dear {customer_name}, a payment of {amount:,.0f} UZS is due today. Nasiya365",
+    },
+    "Просрочка": {
+        "uz": "Hurmatli {customer_name}, {amount:,.0f} so'm to'lov {days_overdue} kun kechiktirildi. Iltimos, to'lang. Nasiya365",
+        "ru": "Уважаемый(ая) {customer_name}, оплата {amount:,.0f} сум просрочена на {days_overdue} дн. Пожалуйста, оплатите. Nasiya365",
+        "en": "Dear {customer_name}, your payment of {amount:,.0f} UZS is {days_overdue} days overdue. Please pay. Nasiya365",
+    },
+}
+
+
+def get_language(message_language):
+    """Template language for a Customer Profile message_language value"""
+    return LANGUAGE_CODES.get(message_language or "", DEFAULT_LANGUAGE)
+
+
+@lru_cache(maxsize=None)
+def get_compiled_template(message_type, language):
+    """
+    Compile the template for a message type and language
+
+    The template is parsed once into literal parts and (field, format spec)
+    pairs; rendering then only formats values. Falls back to the default
+    language when there is no translation.
+    """
+    translations = TEMPLATES.get(message_type)
+    if not translations:
+        raise KeyError(f"No notification template for {message_type}")
+
+    source = translations.get(language) or translations[DEFAULT_LANGUAGE]
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(source):
+        if literal:
+            parts.append((literal, None, None))
+        if field is not None:
+            parts.append((None, field, ("{:" + spec + "}").format))
+
+    return tuple(parts)
+
+
+def render_message(message_type, language, values):
+    """
+    Render a notification for one recipient
+
+    Args:
+        message_type: SMS Message type, e.g. "Напоминание"
+        language: Template language code (see get_language)
+        values: dict with the template placeholders
+
+    Returns:
+        str: Message text
+    """
+    out = []
+    for literal, field, format_value in get_compiled_template(message_type, language):
+        if literal is not None:
+            out.append(literal)
+        else:
+            value = values.get(field)
+            out.append(format_value(value) if value is not None else "")
+    return "".join(out)
@@ -3,9 +3,69 @@ PDF Generation Utility for Nasiya365
 Uses WeasyPrint to generate PDFs from Jinja2 templates
 """
 
+import hashlib
+import time
+
 import frappe
 from frappe import _
-from jinja2 import Template
+from jinja2 import Environment
+
+from nasiya365.utils import jinja_filters
+
+
+_jinja_env = None
+
+# (site, Print Template name) -> (modified, CompiledTemplate)
+_compiled_templates = {}
+
+_renderer = None
+
+# site -> (expires at, Merchant Settings dict)
+_merchant_settings = {}
+MERCHANT_SETTINGS_TTL = 60
+
+
+class CompiledTemplate:
+    """Compiled header/body/footer and the full stylesheet of a Print Template"""
+
+    def __init__(self, template_doc):
+        env = get_jinja_env()
+        self.header = env.from_string(template_doc.header_html) if template_doc.header_html else None
+        self.body = env.from_string(template_doc.body_html or "")
+        self.footer = env.from_string(template_doc.footer_html) if template_doc.footer_html else None
+        self.css = get_base_css(template_doc) + (template_doc.css_styles or "")
+
+
+def get_jinja_env():
+    """Process-wide Jinja environment with the app's template filters"""
+    global _jinja_env
+    if _jinja_env is None:
+        env = Environment()
+        for name in ("currency_format", "date_format", "phone_format"):
+            env.filters[name] = getattr(jinja_filters, name)
+        for name in ("currency_format", "date_format", "phone_format", "passport_format"):
+            env.globals[name] = getattr(jinja_filters, name)
+        _jinja_env = env
+    return _jinja_env
+
+
+def get_compiled_template(template_doc):
+    """
+    Compiled form of a Print Template, cached per process
+
+    Entries are keyed by the template's name and `modified` timestamp, so
+    an edited template is recompiled on first use after saving.
+    """
+    key = (frappe.local.site, template_doc.name)
+    modified = str(template_doc.modified)
+
+    cached = _compiled_templates.get(key)
+    if cached and cached[0] == modified:
+        return cached[1]
+
+    compiled = CompiledTemplate(template_doc)
+    _compiled_templates[key] = (modified, compiled)
+    return compiled
 
 
 def generate_contract_pdf(contract_name):
@@ -18,36 +78,192 @@ def generate_contract_pdf(contract_name):
     Returns:
         bytes: PDF content or None if failed
     """
-    contract = frappe.get_doc("Contract", contract_name)
+    html_content, css = render_contract_html(contract_name)
     
-    if not contract.template:
-        frappe.throw(_("Шаблон печати не выбран для этого договора"))
+    # Generate PDF
+    return _render_pdf(html_content, css)
+
+
+def render_contract_html(contract_name):
+    """
+    Render a contract's HTML and stylesheet; everything that needs the database
     
-    template_doc = frappe.get_doc("Print Template", contract.template)
+    Returns:
+        tuple: (html, css)
+    """
+    rendered = render_contract_htmls([contract_name])[contract_name]
+    if isinstance(rendered, Exception):
+        raise rendered
+    return rendered
+
+
+def render_contract_htmls(contract_names):
+    """
+    Render HTML and stylesheet for a batch of contracts
     
-    # Gather all context data
-    context = get_template_context(contract)
+    Contexts are loaded with grouped queries for the whole batch. A
+    contract that cannot be rendered maps to the exception instead.
     
-    # Render template
-    html_content = render_template(template_doc, context)
+    Returns:
+        dict: contract name -> (html, css) or Exception
+    """
+    contexts = get_template_contexts(contract_names)
+    templates = {}
+    rendered = {}
+    
+    for name in contract_names:
+        try:
+            context = contexts.get(name)
+            if not context:
+                raise frappe.DoesNotExistError(_("Договор {0} не найден").format(name))
+            
+            template_name = context["contract"].template
+            if not template_name:
+                frappe.throw(_("Шаблон печати не выбран для этого договора"))
+            
+            if template_name not in templates:
+                templates[template_name] = frappe.get_doc("Print Template", template_name)
+            template_doc = templates[template_name]
+            
+            rendered[name] = render_template(template_doc, context), get_compiled_template(template_doc).css
+        except Exception as e:
+            rendered[name] = e
+    
+    return rendered
+
+
+def html_to_pdf(html_content, css):
+    """
+    Convert rendered HTML to PDF with WeasyPrint
     
-    # Generate PDF
-    try:
-        from weasyprint import HTML, CSS
-        
-        # Create base CSS
-        base_css = get_base_css(template_doc)
-        
-        # Add custom CSS from template
-        if template_doc.css_styles:
-            base_css += template_doc.css_styles
-        
-        html = HTML(string=html_content)
-        css = CSS(string=base_css)
-        
-        pdf_bytes = html.write_pdf(stylesheets=[css])
-        return pdf_bytes
+    Needs no database or site context, so it can run in a worker process.
+    """
+    return get_renderer().render(html_content, css)
+
+
+class PDFRenderer:
+    """
+    Long-lived WeasyPrint renderer
+    
+    Keeps one font configuration and the parsed stylesheets, so fonts are
+    resolved and CSS is parsed once per process rather than once per PDF.
+    """
+    
+    MAX_STYLESHEETS = 32
+    
+    def __init__(self):
+        from weasyprint import CSS, HTML
+        try:
+            from weasyprint.text.fonts import FontConfiguration
+        except ImportError:
+            # WeasyPrint < 53
+            from weasyprint.fonts import FontConfiguration
         
+        self.CSS = CSS
+        self.HTML = HTML
+        self.font_config = FontConfiguration()
+        self.stylesheets = {}
+    
+    def get_stylesheet(self, css):
+        stylesheet = self.stylesheets.get(css)
+        if stylesheet is None:
+            if len(self.stylesheets) >= self.MAX_STYLESHEETS:
+                self.stylesheets.pop(next(iter(self.stylesheets)))
+            stylesheet = self.CSS(string=css, font_config=self.font_config)
+            self.stylesheets[css] = stylesheet
+        return stylesheet
+    
+    def render(self, html_content, css):
+        return self.HTML(string=html_content).write_pdf(
+            stylesheets=[self.get_stylesheet(css)],
+            font_config=self.font_config
+        )
+
+
+def get_renderer():
+    """The process's PDFRenderer, created on first use"""
+    global _renderer
+    if _renderer is None:
+        _renderer = PDFRenderer()
+    return _renderer
+
+
+def benchmark_renderer(runs=20):
+    """
+    Per-PDF latency of a one-page contract, fresh WeasyPrint objects vs the shared renderer
+    
+    Usage: bench --site <site> execute nasiya365.utils.pdf.benchmark_renderer --kwargs "{'runs': 20}"
+    """
+    from weasyprint import CSS, HTML
+    
+    template_doc = frappe._dict({
+        "name": "_Benchmark Contract",
+        "modified": "benchmark",
+        "header_html": "<h2>{{ merchant.company_name }}</h2>",
+        "body_html": BENCHMARK_BODY,
+        "footer_html": "{{ today | date_format }}",
+        "page_size": "A4",
+        "orientation": "Portrait"
+    })
+    html_content = render_template(template_doc, generate_sample_context())
+    css = get_compiled_template(template_doc).css
+    
+    def fresh():
+        HTML(string=html_content).write_pdf(stylesheets=[CSS(string=css)])
+    
+    renderer = PDFRenderer()
+    renderer.render(html_content, css)  # warm up fonts and stylesheet
+    
+    timings = {}
+    for name, run in (("fresh objects", fresh), ("shared renderer", lambda: renderer.render(html_content, css))):
+        start = time.perf_counter()
+        for _i in range(runs):
+            run()
+        timings[name] = round((time.perf_counter() - start) * 1000 / runs, 1)
+    
+    for name, ms in timings.items():
+        print(f"{name:<16} {ms:>8.1f} ms per PDF ({runs} runs)")
+    
+    return timings
+
+
+BENCHMARK_BODY = """
+<h1>Договор № {{ contract.contract_number }}</h1>
+<p>Клиент: {{ customer.customer_name }}, {{ customer.phone }}</p>
+<table>
+    <tr><th>#</th><th>Срок</th><th>Сумма</th></tr>
+    {% for row in installment_plan.schedule %}
+    <tr><td>{{ row.installment_number }}</td><td>{{ row.due_date | date_format }}</td><td>{{ row.amount | currency_format }}</td></tr>
+    {% endfor %}
+</table>
+"""
+
+
+def get_contract_pdf(contract_name):
+    """
+    Return the contract's PDF file URL, rendering it only if its content changed
+    
+    PDFs are stored under a hash of the rendered HTML and CSS. If a file
+    for the same hash is already attached it is reused, so printing an
+    unchanged contract again neither runs WeasyPrint nor adds a File.
+    (Templates printing the current time change on every call.)
+    
+    Returns:
+        str: File URL
+    """
+    html_content, css = render_contract_html(contract_name)
+    content_hash = get_content_hash(html_content, css)
+    
+    file_url = get_cached_pdf(contract_name, content_hash)
+    if file_url:
+        return file_url
+    
+    return attach_contract_pdf(contract_name, _render_pdf(html_content, css), content_hash)
+
+
+def _render_pdf(html_content, css):
+    try:
+        return html_to_pdf(html_content, css)
     except ImportError:
         frappe.log_error("WeasyPrint not installed", "PDF Generation Error")
         frappe.throw(_("Библиотека генерации PDF недоступна"))
@@ -56,48 +272,164 @@ def generate_contract_pdf(contract_name):
         frappe.throw(_("Ошибка при генерации PDF: {0}").format(str(e)))
 
 
+def get_content_hash(html_content, css):
+    """SHA-256 of the rendered document, the key of the PDF cache"""
+    digest = hashlib.sha256(html_content.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(css.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_cached_pdf(contract_name, content_hash):
+    """File URL of an attached PDF rendered from identical content, if any"""
+    return frappe.db.get_value("File", {
+        "attached_to_doctype": "Contract",
+        "attached_to_name": contract_name,
+        "file_name": get_pdf_file_name(contract_name, content_hash)
+    }, "file_url")
+
+
+def get_pdf_file_name(contract_name, content_hash=None):
+    if content_hash:
+        return f"Contract-{contract_name}-{content_hash[:16]}.pdf"
+    return f"Contract-{contract_name}.pdf"
+
+
+def attach_contract_pdf(contract_name, pdf_content, content_hash=None):
+    """Save PDF content as a private File attached to the contract; returns the file URL"""
+    return attach_pdf("Contract", contract_name, get_pdf_file_name(contract_name, content_hash), pdf_content)
+
+
+def attach_pdf(doctype, name, file_name, pdf_content):
+    """Save PDF content as a private File attached to a document; returns the file URL"""
+    file_doc = frappe.get_doc({
+        "doctype": "File",
+        "file_name": file_name,
+        "attached_to_doctype": doctype,
+        "attached_to_name": name,
+        "content": pdf_content,
+        "is_private": 1
+    })
+    file_doc.insert()
+    return file_doc.file_url
+
+
 def get_template_context(contract):
     """
     Build the context dictionary for template rendering
     """
-    context = {
-        "contract": contract.as_dict()
-    }
+    return get_template_contexts([contract.name])[contract.name]
+
+
+def get_template_contexts(contract_names):
+    """
+    Build template contexts for a batch of contracts
     
-    # Customer data
-    if contract.customer:
-        customer = frappe.get_doc("Customer Profile", contract.customer)
-        context["customer"] = customer.as_dict()
+    Contracts, customers, plans, sales orders and their child rows are
+    read with one query per table for the whole batch and returned as
+    plain dicts shaped like Document.as_dict().
     
-    # Installment plan data
-    if contract.installment_plan:
-        plan = frappe.get_doc("Installment Plan", contract.installment_plan)
-        context["installment_plan"] = plan.as_dict()
-        context["installment_plan"]["schedule"] = [s.as_dict() for s in plan.schedule]
+    Returns:
+        dict: contract name -> context
+    """
+    contracts = load_records("Contract", contract_names)
+    customers = load_records("Customer Profile", {c.customer for c in contracts.values()})
+    plans = load_records("Installment Plan", {c.installment_plan for c in contracts.values()})
+    sales_orders = load_records("Sales Order", {c.sales_order for c in contracts.values()})
     
-    # Sales order and items
-    if contract.sales_order:
-        sales_order = frappe.get_doc("Sales Order", contract.sales_order)
-        context["sales_order"] = sales_order.as_dict()
-        context["items"] = [item.as_dict() for item in sales_order.items]
-    else:
-        context["items"] = []
+    load_children(customers, "Customer Profile", "phone_numbers", "Customer Phone Number")
+    load_children(plans, "Installment Plan", "schedule", "Installment Schedule")
+    load_children(sales_orders, "Sales Order", "items", "Sales Order Item")
     
-    # Merchant settings
-    settings = frappe.get_single("Merchant Settings")
-    context["merchant"] = settings.as_dict()
+    merchant = get_merchant_settings()
+    today, now = frappe.utils.today(), frappe.utils.now()
     
-    # Format helpers
-    context["today"] = frappe.utils.today()
-    context["now"] = frappe.utils.now()
+    contexts = {}
+    for name, contract in contracts.items():
+        context = {"contract": contract}
+        
+        # Customer data
+        if contract.customer in customers:
+            context["customer"] = customers[contract.customer]
+        
+        # Installment plan data
+        if contract.installment_plan in plans:
+            context["installment_plan"] = plans[contract.installment_plan]
+        
+        # Sales order and items
+        sales_order = sales_orders.get(contract.sales_order)
+        if sales_order:
+            context["sales_order"] = sales_order
+            context["items"] = sales_order["items"]
+        else:
+            context["items"] = []
+        
+        # Merchant settings
+        context["merchant"] = merchant
+        
+        # Format helpers
+        context["today"] = today
+        context["now"] = now
+        
+        contexts[name] = context
+    
+    return contexts
+
+
+def get_merchant_settings():
+    """
+    Merchant Settings as a dict, cached per process
     
-    return context
+    Refreshed after MERCHANT_SETTINGS_TTL seconds, so a saved change shows
+    up in printed documents within that time.
+    """
+    site = frappe.local.site
+    cached = _merchant_settings.get(site)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    settings = frappe.get_cached_doc("Merchant Settings").as_dict()
+    _merchant_settings[site] = (time.monotonic() + MERCHANT_SETTINGS_TTL, settings)
+    return settings
+
+
+def load_records(doctype, names):
+    """Full rows of the named records as dicts, one query; name -> record"""
+    names = tuple(name for name in names if name)
+    if not names:
+        return {}
+    
+    records = frappe.db.sql(f"SELECT * FROM `tab{doctype}` WHERE name IN %(names)s", {"names": names}, as_dict=True)
+    for record in records:
+        record.doctype = doctype
+    return {record.name: record for record in records}
+
+
+def load_children(parents, parenttype, parentfield, child_doctype):
+    """Load child rows of all parents in one query and set them under parentfield"""
+    for parent in parents.values():
+        parent[parentfield] = []
+    
+    if not parents:
+        return
+    
+    rows = frappe.db.sql(f"""
+        SELECT * FROM `tab{child_doctype}`
+        WHERE parent IN %(parents)s AND parenttype = %(parenttype)s AND parentfield = %(parentfield)s
+        ORDER BY parent, idx
+    """, {"parents": tuple(parents), "parenttype": parenttype, "parentfield": parentfield}, as_dict=True)
+    
+    for row in rows:
+        row.doctype = child_doctype
+        parents[row.parent][parentfield].append(row)
 
 
 def render_template(template_doc, context):
     """
     Render the HTML template with Jinja2
     """
+    compiled = get_compiled_template(template_doc)
+    
     # Build full HTML document
     html_parts = []
     
@@ -105,28 +437,26 @@ def render_template(template_doc, context):
     html_parts.append("<html>")
     html_parts.append("<head>")
     html_parts.append('<meta charset="UTF-8">')
-    html_parts.append(f"<title>Contract {context['contract']['name']}</title>")
+    title = context.get("title") or f"Contract {context['contract']['name']}"
+    html_parts.append(f"<title>{title}</title>")
     html_parts.append("</head>")
     html_parts.append("<body>")
     
     # Render header
-    if template_doc.header_html:
-        header_template = Template(template_doc.header_html)
+    if compiled.header:
         html_parts.append('<div class="header">')
-        html_parts.append(header_template.render(**context))
+        html_parts.append(compiled.header.render(**context))
         html_parts.append("</div>")
     
     # Render body
-    body_template = Template(template_doc.body_html)
     html_parts.append('<div class="body">')
-    html_parts.append(body_template.render(**context))
+    html_parts.append(compiled.body.render(**context))
     html_parts.append("</div>")
     
     # Render footer
-    if template_doc.footer_html:
-        footer_template = Template(template_doc.footer_html)
+    if compiled.footer:
         html_parts.append('<div class="footer">')
-        html_parts.append(footer_template.render(**context))
+        html_parts.append(compiled.footer.render(**context))
         html_parts.append("</div>")
     
     html_parts.append("</body>")
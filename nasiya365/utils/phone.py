@@ -0,0 +1,60 @@
+"""
+Phone Numbers for Nasiya365
+Canonical E.164 form of customer phone numbers and lookups by it
+"""
+
+import re
+
+import frappe
+
+
+COUNTRY_CODE = "998"
+
+# Uzbek subscriber numbers: 2-digit operator code + 7 digits
+SUBSCRIBER_DIGITS = 9
+
+
+def normalize_phone(value):
+    """
+    E.164 form of a phone number, e.g. "+998901234567"
+
+    Accepts the shapes found in the data: 9-digit local numbers, 998... with
+    or without "+", and spaces, dashes or brackets anywhere. Other numbers
+    written with "+" and a country code are kept as they are. Returns None
+    for anything that is not a usable number, including the all-zero
+    placeholder used by imports.
+    """
+    if not value:
+        return None
+
+    value = str(value).strip()
+    digits = re.sub(r"\D", "", value)
+
+    if len(digits) == SUBSCRIBER_DIGITS:
+        digits = COUNTRY_CODE + digits
+    elif digits.startswith(COUNTRY_CODE) and len(digits) == len(COUNTRY_CODE) + SUBSCRIBER_DIGITS:
+        pass
+    elif not (value.startswith("+") and 8 <= len(digits) <= 15):
+        return None
+
+    if not digits[-SUBSCRIBER_DIGITS:].strip("0"):
+        return None
+
+    return f"+{digits}"
+
+
+def find_customer_by_phone(phone):
+    """
+    Customer Profile owning a phone number, via the unique phone_normalized
+    index; numbers that do not normalize are matched as stored
+    """
+    normalized = normalize_phone(phone)
+    if normalized:
+        filters = {"phone_normalized": normalized}
+    elif phone:
+        filters = {"phone_number": phone}
+    else:
+        return None
+
+    filters["parenttype"] = "Customer Profile"
+    return frappe.db.get_value("Customer Phone Number", filters, "parent")
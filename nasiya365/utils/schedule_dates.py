@@ -0,0 +1,77 @@
+"""
+Schedule Dates for Nasiya365
+Due date generation shared by Installment Plan and the preview endpoint
+"""
+
+import calendar
+from datetime import timedelta
+from functools import lru_cache
+
+import frappe
+from frappe.utils import getdate
+
+
+# Days between installments; any other frequency is monthly
+FREQUENCY_DAYS = {
+    "Еженедельно": 7,
+    "Раз в две недели": 14,
+}
+
+SUNDAY = 6
+
+
+def get_due_dates(start_date, frequency, count, non_working_days=None):
+    """
+    Due dates for `count` installments starting on `start_date`
+
+    Monthly dates are computed from the start date rather than from the
+    previous installment, so a plan starting on the 31st is due on the last
+    day of short months and back on the 31st afterwards. Dates falling on a
+    non-working day move to the next working day.
+
+    Args:
+        non_working_days: (holiday dates, weekdays) as frozensets; defaults
+            to the Merchant Settings calendar
+
+    Returns:
+        list: datetime.date per installment
+    """
+    if non_working_days is None:
+        non_working_days = get_non_working_days()
+
+    return list(_due_dates(getdate(start_date), frequency, int(count), non_working_days))
+
+
+@lru_cache(maxsize=4096)
+def _due_dates(start, frequency, count, non_working_days):
+    holidays, weekdays = non_working_days
+    step = FREQUENCY_DAYS.get(frequency)
+    dates = []
+
+    for i in range(count):
+        if step:
+            due = start + timedelta(days=step * i)
+        else:
+            month = start.month - 1 + i
+            year, month = start.year + month // 12, month % 12 + 1
+            due = start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+        while due in holidays or due.weekday() in weekdays:
+            due += timedelta(days=1)
+
+        dates.append(due)
+
+    return tuple(dates)
+
+
+def get_non_working_days():
+    """Holidays and weekly days off from Merchant Settings"""
+    holidays = frappe.db.get_single_value("Merchant Settings", "holidays", cache=True)
+    skip_sundays = frappe.db.get_single_value("Merchant Settings", "skip_sundays", cache=True)
+    return parse_holidays(holidays or ""), frozenset({SUNDAY} if skip_sundays else ())
+
+
+@lru_cache(maxsize=16)
+def parse_holidays(text):
+    """Parse one YYYY-MM-DD date per line; raises ValueError on bad input"""
+    return frozenset(getdate(line.strip()) for line in text.splitlines() if line.strip())
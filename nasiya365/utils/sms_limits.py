@@ -0,0 +1,160 @@
+"""
+SMS Provider Limits for Nasiya365
+Redis-backed auth tokens with single-flight refresh, a distributed
+token-bucket rate limiter per provider and sender ID, and send metrics
+shared by every worker
+"""
+
+import time
+
+import frappe
+from frappe.utils import today
+
+
+# Requests per second and burst size per provider; override with
+# nasiya365_sms_rate_limits = {"Eskiz": [rate, burst]} in site config
+DEFAULT_RATE_LIMITS = {
+    "Eskiz": (5, 10),
+    "Playmobile": (10, 20),
+}
+
+# How long a worker waits for another worker's token refresh
+TOKEN_WAIT_TIMEOUT = 15
+TOKEN_LOCK_TIMEOUT = 30
+
+METRICS_TTL = 35 * 24 * 60 * 60
+
+# Refill the bucket from the elapsed time and take `requested` tokens if
+# available. Returns the seconds to wait, "0" when the tokens were taken.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+def get_token(provider, login, ttl):
+    """
+    Return the provider's auth token, logging in at most once across workers
+
+    The first worker to find the token missing takes a Redis lock and calls
+    `login()`; the others wait for the token it stores instead of racing to
+    log in themselves.
+
+    Args:
+        login: callable returning a fresh token or None
+        ttl: seconds to keep the token
+    """
+    cache = frappe.cache()
+    key = cache.make_key(f"nasiya365:sms_token:{provider}")
+
+    token = cache.get(key)
+    if token:
+        return frappe.safe_decode(token)
+
+    lock = cache.lock(cache.make_key(f"nasiya365:sms_token_lock:{provider}"), timeout=TOKEN_LOCK_TIMEOUT)
+    if lock.acquire(blocking=False):
+        try:
+            # Another worker may have refreshed between our read and the lock
+            token = cache.get(key)
+            if token:
+                return frappe.safe_decode(token)
+
+            token = login()
+            if token:
+                cache.set(key, token, ex=ttl)
+                record_metric("token_refreshes")
+            return token
+        finally:
+            lock.release()
+
+    deadline = time.monotonic() + TOKEN_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        token = cache.get(key)
+        if token:
+            return frappe.safe_decode(token)
+
+    return None
+
+
+def invalidate_token(provider, token):
+    """Drop a token the provider rejected, unless another worker already replaced it"""
+    cache = frappe.cache()
+    key = cache.make_key(f"nasiya365:sms_token:{provider}")
+    if frappe.safe_decode(cache.get(key) or b"") == token:
+        cache.delete(key)
+
+
+class RateLimiter:
+    """
+    Distributed token bucket for one provider and sender ID
+
+    Build it on the main thread (key names need the site context);
+    `acquire` and `record` are then safe to call from worker threads.
+    """
+
+    def __init__(self, provider, sender_id=None):
+        limits = (frappe.conf.get("nasiya365_sms_rate_limits") or {}).get(provider)
+        self.rate, self.capacity = limits or DEFAULT_RATE_LIMITS.get(provider, (5, 10))
+        self.cache = frappe.cache()
+        self.key = self.cache.make_key(f"nasiya365:sms_rate:{provider}:{sender_id or '-'}")
+        self.metrics_key = _metrics_key()
+
+    def acquire(self, tokens=1, max_wait=60):
+        """Block until the bucket allows a request; returns False after max_wait seconds"""
+        deadline = time.monotonic() + max_wait
+        throttled = False
+
+        while True:
+            wait = float(self.cache.eval(_TOKEN_BUCKET_SCRIPT, 1, self.key, self.rate, self.capacity, tokens))
+            if wait <= 0:
+                return True
+            if not throttled:
+                self.record("throttled")
+                throttled = True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def record(self, metric, amount=1):
+        self.cache.hincrby(self.metrics_key, metric, amount)
+        self.cache.expire(self.metrics_key, METRICS_TTL)
+
+
+def record_metric(metric, amount=1):
+    cache = frappe.cache()
+    key = _metrics_key()
+    cache.hincrby(key, metric, amount)
+    cache.expire(key, METRICS_TTL)
+
+
+@frappe.whitelist()
+def get_sms_metrics(date=None):
+    """Daily counters: throttled, rate_limited, retried, token_refreshes"""
+    frappe.only_for(["System Manager", "Nasiya365 Admin"])
+
+    metrics = frappe.cache().execute_command("HGETALL", _metrics_key(date))
+    return {frappe.safe_decode(k): int(v) for k, v in (metrics or {}).items()}
+
+
+def _metrics_key(date=None):
+    return frappe.cache().make_key(f"nasiya365:sms_metrics:{date or today()}")
@@ -1,6 +1,59 @@
 import frappe
 import requests
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from nasiya365.callbacks import get_callback_url
+from nasiya365.utils.sms_limits import RateLimiter, get_token, invalidate_token, record_metric
+
+ESKIZ_BASE_URL = "https://notify.eskiz.uz/api"
+PLAYMOBILE_URL = "https://send.smsxabar.uz/broker-api/send"
+
+# Messages per provider batch request
+ESKIZ_BATCH_SIZE = 200
+PLAYMOBILE_BATCH_SIZE = 500
+
+# (connect, read) timeouts in seconds; a slow provider must never stall a worker
+REQUEST_TIMEOUT = (5, 20)
+
+# Parallel HTTP requests per batch send, also the connection pool size
+MAX_CONCURRENCY = 8
+
+# Token lasts 30 days usually, keep it for 29 days
+ESKIZ_TOKEN_TTL = 2500000
+
+# HTTP 429 responses are retried this many times, honouring Retry-After
+RATE_LIMIT_RETRIES = 3
+
+# Longest Retry-After (seconds) waited for in a pool thread; a longer one
+# fails the chunk back to the queue's retry backoff
+MAX_RETRY_AFTER = 30
+
+# Queued messages are retried with exponential backoff, then marked failed
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 60
+
+_session = None
+
+
+def get_session():
+    """Process-wide HTTP session so connections to the provider are reused"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        # Only retry failed connects: the request never reached the provider,
+        # so this cannot send an SMS twice
+        retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.5)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENCY, max_retries=retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
 
 class SMSManager:
     def __init__(self):
@@ -10,6 +63,10 @@ class SMSManager:
         except Exception:
             self.provider = None
 
+        # Overridable in site config, e.g. to point at a local fake provider
+        self.eskiz_url = frappe.conf.get("nasiya365_eskiz_url") or ESKIZ_BASE_URL
+        self.playmobile_url = frappe.conf.get("nasiya365_playmobile_url") or PLAYMOBILE_URL
+
     def send_sms(self, phone_number, message):
         """Standardized method to dispatch SMS based on selected provider"""
         if not self.provider:
@@ -27,47 +84,238 @@ class SMSManager:
             frappe.log_error(f"SMS Failed: {str(e)}", "SMS Manager")
             return False
 
-    def _send_eskiz(self, phone, message):
+    def queue_sms(self, phone_number, message, **fields):
+        """
+        Add a message to the outbound queue instead of sending it in-line
+
+        Extra fields (customer, message_type, ...) are stored on the SMS Message.
+        Returns the SMS Message name.
+        """
+        doc = frappe.get_doc({
+            "doctype": "SMS Message",
+            "phone": phone_number,
+            "message": message,
+            "status": "В очереди",
+            **fields
+        })
+        doc.insert(ignore_permissions=True)
+        enqueue_dispatch()
+        return doc.name
+
+    def send_batch(self, messages):
+        """
+        Send many messages with the provider's batch endpoint
+
+        Messages are split into chunks of the provider's batch limit, each
+        chunk goes out as one request, and chunks run in parallel over the
+        pooled session. Only HTTP runs in the worker threads; anything
+        touching the database (token lookup, error logs) stays on the
+        calling thread.
+
+        Args:
+            messages: list of (message_id, phone_number, text); message_id is
+                passed to the provider and comes back in delivery callbacks
+
+        Returns:
+            dict: message_id -> (ok, provider reference or error text)
+        """
+        if not messages:
+            return {}
+
+        if self.provider == "Eskiz":
+            token = self._get_eskiz_token()
+            if not token:
+                return {m[0]: (False, "Eskiz authentication failed") for m in messages}
+            batch_size = ESKIZ_BATCH_SIZE
+            build_request = lambda chunk: self._eskiz_batch_request(token, chunk)
+        elif self.provider == "Playmobile":
+            batch_size = PLAYMOBILE_BATCH_SIZE
+            build_request = self._playmobile_request
+        else:
+            return {m[0]: (False, "No valid SMS Provider configured") for m in messages}
+
+        chunks = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+        responses = self._post_many([build_request(chunk) for chunk in chunks])
+
+        if self.provider == "Eskiz":
+            # Token revoked or expired early: refresh once and resend those chunks
+            rejected = [i for i, (ok, data, status) in enumerate(responses) if status == 401]
+            if rejected:
+                invalidate_token("Eskiz", token)
+                token = self._get_eskiz_token()
+                if token:
+                    record_metric("retried", len(rejected))
+                    retried = self._post_many([self._eskiz_batch_request(token, chunks[i]) for i in rejected])
+                    for i, response in zip(rejected, retried):
+                        responses[i] = response
+
+        results = {}
+        for chunk, (ok, data, status) in zip(chunks, responses):
+            # Eskiz answers with a batch id, Playmobile with an empty body
+            batch_id = str(data.get("id") or "") if ok and isinstance(data, dict) else ""
+            for message_id, phone, text in chunk:
+                results[message_id] = (True, batch_id or message_id) if ok else (False, data)
+
+        return results
+
+    def _post_many(self, requests_to_send):
+        """POST prepared requests in parallel, throttled by the shared rate limiter"""
+        limiter = RateLimiter(self.provider, self.settings.sender_id)
+        workers = min(MAX_CONCURRENCY, len(requests_to_send))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(partial(_post, limiter=limiter), requests_to_send))
+
+    def _get_eskiz_token(self):
+        # Shared across workers; only one of them logs in when it expires
+        return get_token("Eskiz", self._eskiz_login, ESKIZ_TOKEN_TTL)
+
+    def _eskiz_login(self):
         email = self.settings.eskiz_email
         password = self.settings.get_password("eskiz_api_key")
-        
-        # 1. Get Token (ideally cache this)
-        token = frappe.cache().get_value("eskiz_token")
-        if not token:
-            try:
-                response = requests.post("https://notify.eskiz.uz/api/auth/login", data={"email": email, "password": password})
-                data = response.json()
-                if response.status_code != 200:
-                    frappe.log_error(f"Eskiz Auth Failed: {data.get('message')}", "SMS Manager")
-                    return False
-                token = data['data']['token']
-                # Token lasts 30 days usually, set for 29 days
-                frappe.cache().set_value("eskiz_token", token, expires_in_sec=2500000) 
-            except Exception as e:
-                frappe.log_error(f"Eskiz Connection Error: {str(e)}", "SMS Manager")
-                return False
+        try:
+            response = get_session().post(
+                f"{self.eskiz_url}/auth/login",
+                data={"email": email, "password": password},
+                timeout=REQUEST_TIMEOUT
+            )
+            data = response.json()
+            if response.status_code != 200:
+                frappe.log_error(f"Eskiz Auth Failed: {data.get('message')}", "SMS Manager")
+                return None
+            return data['data']['token']
+        except Exception as e:
+            frappe.log_error(f"Eskiz Connection Error: {str(e)}", "SMS Manager")
+            return None
 
-        # 2. Send SMS
+    def _eskiz_request(self, token, phone, message):
         headers = {"Authorization": f"Bearer {token}"}
         # Eskiz format usually requires stripping the plus sign if present, or specific formatting
         clean_phone = phone.replace("+", "").replace(" ", "")
-        
+
         payload = {
-            "mobile_phone": clean_phone, 
+            "mobile_phone": clean_phone,
             "message": message,
-            "from": "4546", # This should ideally be self.settings.sender_id
-            "callback_url": frappe.utils.get_url("/api/method/nasiya365.callbacks.sms_status")
+            "from": self.settings.sender_id or "4546",
+            "callback_url": get_callback_url()
         }
-        
-        try:
-            res = requests.post("https://notify.eskiz.uz/api/message/sms/send", headers=headers, data=payload)
-            return res.json()
-        except Exception as e:
-            frappe.log_error(f"Eskiz Send Error: {str(e)}", "SMS Manager")
+        return f"{self.eskiz_url}/message/sms/send", {"headers": headers, "data": payload}
+
+    def _eskiz_batch_request(self, token, chunk):
+        headers = {"Authorization": f"Bearer {token}"}
+        payload = {
+            "messages": [
+                {"user_sms_id": message_id, "to": _digits(phone), "text": text}
+                for message_id, phone, text in chunk
+            ],
+            "from": self.settings.sender_id or "4546",
+            "dispatch_id": int(time.time()),
+            "callback_url": get_callback_url()
+        }
+        return f"{self.eskiz_url}/message/sms/send-batch", {"headers": headers, "json": payload}
+
+    def _playmobile_request(self, chunk):
+        payload = {
+            "messages": [
+                {
+                    "recipient": _digits(phone),
+                    "message-id": message_id,
+                    "sms": {
+                        "originator": self.settings.sender_id,
+                        "content": {"text": text}
+                    }
+                }
+                for message_id, phone, text in chunk
+            ]
+        }
+        auth = (self.settings.playmobile_username, self.settings.get_password("playmobile_password"))
+        return self.playmobile_url, {"auth": auth, "json": payload}
+
+    def _send_eskiz(self, phone, message):
+        # 1. Get Token (cached)
+        token = self._get_eskiz_token()
+        if not token:
+            return False
+
+        # 2. Send SMS
+        limiter = RateLimiter("Eskiz", self.settings.sender_id)
+        ok, result, status = _post(self._eskiz_request(token, phone, message), limiter)
+        if status == 401:
+            invalidate_token("Eskiz", token)
+            token = self._get_eskiz_token()
+            if token:
+                record_metric("retried")
+                ok, result, status = _post(self._eskiz_request(token, phone, message), limiter)
+        if not ok:
+            frappe.log_error(f"Eskiz Send Error: {result}", "SMS Manager")
             return False
+        return result
 
     def _send_playmobile(self, phone, message):
-        # Placeholder for Playmobile implementation
-        # You would implement similar logic here: Auth -> Send
-        frappe.log_error("Playmobile integration not yet implemented", "SMS Manager")
-        return False
+        message_id = frappe.generate_hash(length=10)
+        ok, result = self.send_batch([(message_id, phone, message)])[message_id]
+        if not ok:
+            frappe.log_error(f"Playmobile Send Error: {result}", "SMS Manager")
+            return False
+        return {"id": message_id}
+
+
+def _post(request, limiter=None):
+    """
+    POST one prepared request; safe to call from worker threads
+
+    Waits for the rate limiter before each attempt and retries HTTP 429
+    (the provider did not accept the message, so a resend is safe), unless
+    the provider asks to wait longer than MAX_RETRY_AFTER.
+
+    Returns:
+        tuple: (ok, response data or error text, HTTP status or None)
+    """
+    url, kwargs = request
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        if limiter and not limiter.acquire():
+            return False, "Rate limit wait exceeded", None
+
+        try:
+            response = get_session().post(url, timeout=REQUEST_TIMEOUT, **kwargs)
+        except requests.RequestException as e:
+            return False, str(e), None
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"message": response.text[:500]}
+
+        if response.status_code == 429 and attempt < RATE_LIMIT_RETRIES:
+            if limiter:
+                limiter.record("rate_limited")
+                limiter.record("retried")
+            try:
+                delay = float(response.headers.get("Retry-After") or 0)
+            except ValueError:
+                delay = 0
+            delay = delay or 2 ** attempt
+            if delay > MAX_RETRY_AFTER:
+                return False, f"HTTP 429: Retry-After {delay:g}s exceeds {MAX_RETRY_AFTER}s", response.status_code
+            time.sleep(delay)
+            continue
+
+        if response.status_code != 200:
+            if response.status_code == 429 and limiter:
+                limiter.record("rate_limited")
+            return False, f"HTTP {response.status_code}: {json.dumps(data, ensure_ascii=False)[:500]}", response.status_code
+        return True, data, response.status_code
+
+
+def _digits(phone):
+    return "".join(ch for ch in str(phone) if ch.isdigit())
+
+
+def enqueue_dispatch():
+    """Start the SMS queue sender unless one is already queued"""
+    frappe.enqueue(
+        "nasiya365.tasks.notifications.process_sms_queue",
+        queue=frappe.conf.get("nasiya365_sms_queue") or "short",
+        job_id="nasiya365_sms_queue",
+        deduplicate=True,
+        enqueue_after_commit=True
+    )
@@ -0,0 +1,285 @@
+"""
+Customer Statements for Nasiya365
+Opening balance, installments due, fees, payments and closing balance per
+customer for a period, computed for whole batches with grouped queries
+"""
+
+import hashlib
+
+import frappe
+from frappe import _
+from frappe.utils import flt, getdate
+
+from nasiya365.nasiya365.doctype.print_template.print_template import get_default_template
+from nasiya365.utils.notification_templates import get_language
+from nasiya365.utils.pdf import (
+    get_compiled_template,
+    get_merchant_settings,
+    load_children,
+    load_records,
+    render_template
+)
+
+
+TEMPLATE_TYPE = "Выписка"
+
+# Payment Transaction is not submittable; payments against a plan count
+# only when the plan itself is submitted, like its installments
+PAYMENT_PLAN_CONDITION = """
+        AND NOT EXISTS (
+            SELECT 1 FROM `tabInstallment Plan` ip
+            WHERE pt.reference_doctype = 'Installment Plan'
+            AND ip.name = pt.reference_name
+            AND ip.docstatus != 1
+        )"""
+
+# Used when no "Выписка" Print Template exists yet
+DEFAULT_TEMPLATE = frappe._dict({
+    "name": "_default_statement",
+    "modified": "2026-10-19",
+    "header_html": "<h2>{{ merchant.company_name }}</h2>",
+    "body_html": """
+<h1>Выписка по счету</h1>
+<p>{{ customer.first_name }} {{ customer.last_name }}, {{ customer.phone | phone_format }}</p>
+<p>Период: {{ statement.from_date | date_format }} — {{ statement.to_date | date_format }}</p>
+<table>
+    <tr><th>Дата</th><th>Операция</th><th>Начислено</th><th>Оплачено</th></tr>
+    <tr><td colspan="2" class="bold">Входящий остаток</td><td colspan="2" class="text-right bold">{{ statement.opening_balance | currency_format }}</td></tr>
+    {% for line in statement.lines %}
+    <tr>
+        <td>{{ line.date | date_format }}</td>
+        <td>{{ line.description }}</td>
+        <td class="text-right">{% if line.charge %}{{ line.charge | currency_format }}{% endif %}</td>
+        <td class="text-right">{% if line.payment %}{{ line.payment | currency_format }}{% endif %}</td>
+    </tr>
+    {% endfor %}
+    <tr><td colspan="2" class="bold">Исходящий остаток</td><td colspan="2" class="text-right bold">{{ statement.closing_balance | currency_format }}</td></tr>
+</table>
+""",
+    "footer_html": "{{ today | date_format }}",
+    "page_size": "A4",
+    "orientation": "Portrait"
+})
+
+
+def get_statements(customers, from_date, to_date):
+    """
+    Compute statements for a batch of customers
+
+    Balances count installments as charged on their due date: the
+    opening balance is everything due, plus fees, minus payments before
+    `from_date`; the closing balance adds the period's installments and
+    fees and subtracts its payments.
+
+    Returns:
+        dict: customer -> frappe._dict with from_date, to_date,
+            opening_balance, charges, fees, payments, closing_balance and
+            lines (date, description, charge, payment) ordered by date
+    """
+    customers = tuple(customers)
+    if not customers:
+        return {}
+
+    values = {"customers": customers, "from_date": getdate(from_date), "to_date": getdate(to_date)}
+
+    due = frappe.db.sql("""
+        SELECT
+            ip.customer,
+            SUM(CASE WHEN isc.due_date < %(from_date)s THEN isc.amount ELSE 0 END) as due_before,
+            SUM(CASE WHEN isc.due_date >= %(from_date)s THEN isc.amount ELSE 0 END) as charges
+        FROM `tabInstallment Schedule` isc
+        INNER JOIN `tabInstallment Plan` ip ON ip.name = isc.parent
+        WHERE ip.customer IN %(customers)s
+        AND ip.docstatus = 1
+        AND isc.due_date <= %(to_date)s
+        GROUP BY ip.customer
+    """, values, as_dict=True)
+
+    paid = frappe.db.sql(f"""
+        SELECT
+            customer,
+            SUM(CASE WHEN payment_date < %(from_date)s THEN amount ELSE 0 END) as paid_before,
+            SUM(CASE WHEN payment_date < %(from_date)s THEN IFNULL(late_fee_applied, 0) ELSE 0 END) as fees_before,
+            SUM(CASE WHEN payment_date >= %(from_date)s THEN amount ELSE 0 END) as payments,
+            SUM(CASE WHEN payment_date >= %(from_date)s THEN IFNULL(late_fee_applied, 0) ELSE 0 END) as fees
+        FROM `tabPayment Transaction` pt
+        WHERE customer IN %(customers)s
+        AND status = 'Завершен'
+        AND docstatus < 2
+        {PAYMENT_PLAN_CONDITION}
+        AND payment_date <= %(to_date)s
+        GROUP BY customer
+    """, values, as_dict=True)
+
+    statements = {
+        customer: frappe._dict(
+            from_date=values["from_date"],
+            to_date=values["to_date"],
+            opening_balance=0,
+            charges=0,
+            fees=0,
+            payments=0,
+            closing_balance=0,
+            lines=[]
+        )
+        for customer in customers
+    }
+
+    for row in due:
+        statement = statements[row.customer]
+        statement.opening_balance += flt(row.due_before)
+        statement.charges = flt(row.charges)
+
+    for row in paid:
+        statement = statements[row.customer]
+        statement.opening_balance += flt(row.fees_before) - flt(row.paid_before)
+        statement.fees = flt(row.fees)
+        statement.payments = flt(row.payments)
+
+    for statement in statements.values():
+        statement.closing_balance = (
+            statement.opening_balance + statement.charges + statement.fees - statement.payments
+        )
+
+    _add_lines(statements, values)
+    return statements
+
+
+def _add_lines(statements, values):
+    """Period lines: installments falling due and payments received"""
+    installments = frappe.db.sql("""
+        SELECT ip.customer, isc.due_date as date, ip.name as plan, isc.installment_number, isc.amount
+        FROM `tabInstallment Schedule` isc
+        INNER JOIN `tabInstallment Plan` ip ON ip.name = isc.parent
+        WHERE ip.customer IN %(customers)s
+        AND ip.docstatus = 1
+        AND isc.due_date BETWEEN %(from_date)s AND %(to_date)s
+    """, values, as_dict=True)
+
+    payments = frappe.db.sql(f"""
+        SELECT customer, payment_date as date, name, amount, IFNULL(late_fee_applied, 0) as late_fee
+        FROM `tabPayment Transaction` pt
+        WHERE customer IN %(customers)s
+        AND status = 'Завершен'
+        AND docstatus < 2
+        {PAYMENT_PLAN_CONDITION}
+        AND payment_date BETWEEN %(from_date)s AND %(to_date)s
+    """, values, as_dict=True)
+
+    for row in installments:
+        statements[row.customer].lines.append(frappe._dict(
+            date=row.date,
+            description=_("Платеж {0} по {1}").format(row.installment_number, row.plan),
+            charge=flt(row.amount),
+            payment=0
+        ))
+
+    for row in payments:
+        lines = statements[row.customer].lines
+        if flt(row.late_fee):
+            lines.append(frappe._dict(date=row.date, description=_("Пеня"), charge=flt(row.late_fee), payment=0))
+        lines.append(frappe._dict(
+            date=row.date,
+            description=_("Оплата {0}").format(row.name),
+            charge=0,
+            payment=flt(row.amount)
+        ))
+
+    for statement in statements.values():
+        # Charges before payments on the same day
+        statement.lines.sort(key=lambda line: (line.date, line.payment > 0))
+
+
+def render_statement_htmls(statements):
+    """
+    Render statements with the default "Выписка" Print Template of each
+    customer's message language
+
+    Args:
+        statements: customer -> statement, as returned by get_statements
+
+    Returns:
+        dict: customer -> (html, css, content_hash), or the exception
+            raised while rendering that customer
+    """
+    customers = load_records("Customer Profile", statements)
+    load_children(customers, "Customer Profile", "phone_numbers", "Customer Phone Number")
+    merchant = get_merchant_settings()
+    today = frappe.utils.today()
+    templates = {}
+
+    htmls = {}
+    for name, statement in statements.items():
+        customer = customers.get(name)
+        if not customer:
+            continue
+
+        try:
+            language = get_language(customer.message_language)
+            if language not in templates:
+                templates[language] = get_statement_template(language)
+            template_doc = templates[language]
+
+            primary = [p.phone_number for p in customer.phone_numbers if p.is_primary]
+            customer.phone = primary[0] if primary else None
+
+            html = render_template(template_doc, {
+                "title": _("Выписка {0}").format(name),
+                "customer": customer,
+                "statement": statement,
+                "merchant": merchant,
+                "today": today
+            })
+            htmls[name] = (
+                html,
+                get_compiled_template(template_doc).css,
+                get_statement_hash(customer, statement, template_doc, merchant)
+            )
+        except Exception as e:
+            htmls[name] = e
+
+    return htmls
+
+
+def get_statement_template(language):
+    """Default "Выписка" Print Template for a language, or the built-in layout"""
+    template = get_default_template(TEMPLATE_TYPE, language)
+    if template:
+        return frappe.get_cached_doc("Print Template", template.name)
+    return DEFAULT_TEMPLATE
+
+
+def get_statement_hash(customer, statement, template_doc, merchant):
+    """
+    SHA-256 of what a statement shows, the key of the statement PDF cache
+
+    Hashes the data rather than the rendered HTML, which also carries the
+    render date and would make every run produce a new file.
+    """
+    data = {
+        "customer": [customer.first_name, customer.last_name, customer.middle_name, customer.phone],
+        "statement": statement,
+        "template": [template_doc.name, str(template_doc.modified)],
+        "merchant": merchant
+    }
+    return hashlib.sha256(frappe.as_json(data, indent=None).encode("utf-8")).hexdigest()
+
+
+def get_statement_file_name(customer, statement, content_hash):
+    return f"Statement-{customer}-{statement.from_date}-{statement.to_date}-{content_hash[:16]}.pdf"
+
+
+def get_cached_statement(customer, file_name):
+    """URL of an already attached statement PDF with the same content"""
+    return frappe.db.get_value(
+        "File",
+        {"attached_to_doctype": "Customer Profile", "attached_to_name": customer, "file_name": file_name},
+        "file_url"
+    )
+
+
+@frappe.whitelist()
+def get_customer_statement(customer, from_date, to_date):
+    """Statement of one customer for a period"""
+    frappe.has_permission("Customer Profile", "read", doc=customer, throw=True)
+    return get_statements([customer], from_date, to_date)[customer]